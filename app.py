@@ -1,165 +1,300 @@
 # app.py
 
-from flask import Flask, render_template, request, url_for
+from flask import Flask, g, jsonify, redirect, render_template, request, url_for
 import os
-import uuid
+import time
 from datetime import datetime
 from utils.portfolio_optimizer import PortfolioOptimizer
+from utils.strategies import STRATEGIES
+from utils.jobs import JobManager
+from utils.result_cache import ResultCache, fingerprint
 from utils.tickers import TickerData
-from utils.utilities import save_fig
+from utils.price_cache import PriceCache
+from utils.artifacts import ArtifactStore
+from utils.plot_json import PlotPayload
+from utils.instrumentation import PROFILER, instrument
 
 app = Flask(__name__)
+# Worker processes per sensitivity grid. Up to JOB_WORKERS analyses run at once, each forking its own pool, so the
+# default of 1 runs the grid inside the JobManager worker; raise it only when few analyses run concurrently.
+app.config['SENSITIVITY_WORKERS'] = max(1, int(os.environ.get('SENSITIVITY_WORKERS', 1)))
 PLOT_DIR = os.path.join(app.static_folder, 'plots')
-os.makedirs(PLOT_DIR, exist_ok=True)
+# Plot images are named by the hash of their figure spec, so identical charts are rendered once; the store is kept
+# below PLOT_MAX_BYTES and PLOT_MAX_AGE seconds by a background sweeper.
+ARTIFACTS = ArtifactStore(PLOT_DIR,
+                          max_bytes=int(os.environ.get('PLOT_MAX_BYTES', 256 * 2**20)),
+                          max_age=int(os.environ.get('PLOT_MAX_AGE', 7 * 24 * 3600)),
+                          sweep_interval=int(os.environ.get('PLOT_SWEEP_INTERVAL', 300)))
+# Shared on-disk price store; file locks make it safe across gunicorn workers.
+PRICE_CACHE = PriceCache(os.environ.get('PRICE_CACHE_DIR', os.path.join(app.instance_path, 'prices')))
+# Analyses run outside the request: JOB_BACKEND is 'thread' or 'process', JOB_WORKERS bounds concurrent analyses.
+JOBS = JobManager(backend=os.environ.get('JOB_BACKEND', 'thread'),
+                  max_workers=int(os.environ.get('JOB_WORKERS', 2)))
+# Results keyed by the returns matrix and parameters. RESULT_CACHE_DIR adds a disk tier shared by every worker process;
+# the memory tier is per process, so with the process job backend /cache/stats only sees the disk tier's effect.
+RESULTS = ResultCache(max_items=int(os.environ.get('RESULT_CACHE_ITEMS', 128)),
+                      max_bytes=int(os.environ.get('RESULT_CACHE_BYTES', 64 * 2**20)),
+                      disk_dir=os.environ.get('RESULT_CACHE_DIR'))
 
 # Minimum days for computations
 MIN_BACKTEST_DAYS = 252 + 63
 MIN_SENSITIVITY_DAYS = 126 + 21
 
+def _png(fig):
+    name = ARTIFACTS.save(fig)
+    return f'plots/{name}' if name else None
+
+
+def _optimize(optimizer, strategies, tickers, progress):
+    opt = {}
+    for i, strategy in enumerate(strategies):
+        progress(0.05 + 0.15 * i / len(strategies), f'Optimizing: {strategy.name}')
+        name = strategy.name
+        weights, ret, vol = strategy.run(optimizer)
+        optimizer.add_weights(name)
+        opt[name] = {
+            'description': strategy.description,
+            'return': round(ret, 2),
+            'volatility': round(vol, 2),
+            'weights': dict(zip(tickers, [round(w, 2) for w in weights]))
+        }
+    return {'opt': opt, 'weights': optimizer.weight_list}
+
+
+def _visualize(optimizer, mode='png'):
+    # 'png' renders images into the artifact store; 'interactive' sends compact figure JSON for plotly.js instead.
+    payload = PlotPayload() if mode == 'interactive' else None
+    _plot = payload.add if payload is not None else _png
+
+    alloc = optimizer.plot_portfolio_allocation()
+    rc    = optimizer.plot_risk_contributions()
+    cr    = optimizer.plot_cumulative_returns()
+    corr  = optimizer.plot_correlation_matrix()
+    rand, hist = optimizer.simulate_random_portfolios()
+
+    viz = {'alg': {}, 'mode': mode}
+    # per-method images
+    for name in alloc.keys():
+        viz['alg'][name] = {
+            'allocation': _plot(alloc[name]),
+            'risk':       _plot(rc[name]),
+            'cumulative': _plot(cr[name])
+        }
+
+    # correlation & random
+    viz['correlation'] = _plot(corr)
+    viz['random'] = {
+        'scatter':    _plot(rand),
+        'histogram':  _plot(hist)
+    }
+    if payload is not None:
+        viz['figures'] = payload.to_dict()
+    return viz
+
+
+def _artifacts_exist(viz):
+    if viz.get('mode') == 'interactive':
+        return True
+    paths = [path for imgs in viz['alg'].values() for path in imgs.values()]
+    paths += [viz['correlation']] + list(viz['random'].values())
+    return all(path is not None and os.path.exists(os.path.join(app.static_folder, path)) for path in paths)
+
+
+def _backtest(optimizer, data, strategies):
+    results = optimizer.backtest_many(
+        data.index[0], data.index[-1],
+        methods=[s.key for s in strategies],
+        train_window=252, rebalance_period=63,
+        transaction_cost=0.001
+    )
+    back = {}
+    for strategy in strategies:
+        # stats[key] is a dict of metrics
+        method_stats = results.stats[strategy.key]
+        back[strategy.name] = {
+            'Total Return':        round(method_stats['Total Return'], 2),
+            'Annualized Return':   round(method_stats['Annualized Return'], 2),
+            'Annualized Volatility': round(method_stats['Annualized Volatility'], 2),
+            'Sharpe Ratio':        round(method_stats['Sharpe Ratio'], 2),
+            'Maximum Drawdown':    round(method_stats['Maximum Drawdown'], 2)
+        }
+    return back
+
+
+def _sensitivity(optimizer, strategies):
+    grid = optimizer.sensitivity_grid(
+        methods=[s.key for s in strategies],
+        train_windows=[252, 126],
+        rebalance_periods=[63, 21],
+        max_workers=app.config['SENSITIVITY_WORKERS']
+    )
+    sens = {}
+    for strategy in strategies:
+        df = grid[strategy.key]
+        sens[strategy.name] = {
+            'Train Window':         df['Train Window'],
+            'Rebalance Period':     df['Rebalance Period'],
+            'Annualized Return':    [float(f"{v:.3f}") for v in df['Annualized Return']],
+            'Annualized Volatility':[float(f"{v:.3f}") for v in df['Annualized Volatility']],
+            'Sharpe Ratio':         [float(f"{v:.3f}") for v in df['Sharpe Ratio']],
+            'Max Drawdown':         [float(f"{v:.3f}") for v in df['Max Drawdown']]
+        }
+    return sens
+
+
+@instrument('job:run_analysis')
+def run_analysis(params, progress=None):
+    """Run the full analysis for one form submission; plot paths are returned relative to the static folder."""
+    progress = progress or (lambda fraction, message='': None)
+    tickers = params['tickers']
+
+    # — Load data and init optimizer —
+    progress(0.0, 'Loading price data')
+    data = TickerData(tickers, params['start'], params['end'], cache=PRICE_CACHE).ticker_data()
+    if isinstance(data, str):
+        raise ValueError(data)
+    days = len(data)
+    optimizer = PortfolioOptimizer(data, risk_free_rate=params['riskfree'])
+    strategies = list(STRATEGIES.values())
+    # Every section below depends only on the returns, the risk-free rate and the strategy set.
+    key = fingerprint(data, riskfree=params['riskfree'], strategies=[s.key for s in strategies])
+
+    # — 1. Portfolio optimizations —
+    result = RESULTS.get_or_compute(f"{key}:opt", lambda: _optimize(optimizer, strategies, tickers, progress))
+    opt = result['opt']
+    optimizer.weight_list = dict(result['weights'])
+
+    # — 2. Visualization —
+    # Ensure viz.alg always exists to avoid Jinja undefined errors
+    viz = {'alg': {}, 'correlation': None, 'random': {'scatter': None, 'histogram': None}}
+    if params['plots']:
+        progress(0.2, 'Rendering plots')
+        viz = RESULTS.get_or_compute(f"{key}:viz:{params['render']}", lambda: _visualize(optimizer, params['render']),
+                                     validate=_artifacts_exist)
+
+    # — 3. Backtesting —
+    back = {}
+    if params['backtest'] and days >= MIN_BACKTEST_DAYS:
+        progress(0.45, 'Backtesting')
+        back = RESULTS.get_or_compute(f"{key}:backtest:252:63:0.001", lambda: _backtest(optimizer, data, strategies))
+
+    # — 4. Sensitivity Analysis —
+    sens = {}
+    if params['sensitivity'] and days >= MIN_SENSITIVITY_DAYS:
+        progress(0.65, 'Running sensitivity analysis')
+        sens = RESULTS.get_or_compute(f"{key}:sensitivity:252,126:63,21", lambda: _sensitivity(optimizer, strategies))
+
+    progress(1.0, 'Done')
+    return {
+        'generated': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'opt': opt,
+        'viz': viz,
+        'back': back,
+        'sens': sens,
+        'days': days
+    }
+
+
+def _static_urls(viz):
+    """Turn the static-relative plot paths of a finished analysis into URLs; interactive figure ids pass through."""
+    if viz.get('mode') == 'interactive':
+        return viz
+    def url(path):
+        return url_for('static', filename=path) if path else path
+    return {
+        'alg': {name: {kind: url(path) for kind, path in imgs.items()} for name, imgs in viz['alg'].items()},
+        'correlation': url(viz['correlation']),
+        'random': {kind: url(path) for kind, path in viz['random'].items()},
+        'mode': viz.get('mode', 'png')
+    }
+
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'POST':
-        run_id = uuid.uuid4().hex
-
         # — User inputs —
-        tickers = request.form['tickers'].split()
-        start, end = request.form['start'], request.form['end']
-        riskfree = float(request.form['riskfree'])
-        do_plots = 'plots' in request.form
-        do_backtest = 'backtest' in request.form
-        do_sensitivity = 'sensitivity' in request.form
-
-        # — Load data and init optimizer —
-        data = TickerData(tickers, start, end).ticker_data()
-        days = len(data)
-        optimizer = PortfolioOptimizer(data, risk_free_rate=riskfree)
-
-        # — 1. Portfolio optimizations —
-        strategies = [
-            ('Maximum Sharpe Ratio', 'max_sharpe', optimizer.maximize_sharpe_ratio),
-            ('Minimum Volatility',    'min_vol',    optimizer.minimize_volatility),
-            ('Hierarchical Risk Parity','HRP',       optimizer.hierarchical_risk_parity),
-            ('Equal Risk Contribution','ERC',        optimizer.equal_risk_contribution),
-            ('Equal Weight',          'Eq',         optimizer.equal_weight),
-            ('Maximum Diversification','max_div',    optimizer.maximum_diversification),
-            ('Minimum CVaR',          'min_cvar',   lambda: optimizer.minimize_cvar(alpha=0.05)),
-        ]
-        opt = {}
-        for name, key, func in strategies:
-            weights, ret, vol = func()
-            optimizer.add_weights(name)
-            opt[name] = {
-                'description': get_description(name),
-                'return': round(ret, 2),
-                'volatility': round(vol, 2),
-                'weights': dict(zip(tickers, [round(w, 2) for w in weights]))
-            }
-
-        # — 2. Visualization —
-        # Ensure viz.alg always exists to avoid Jinja undefined errors
-        viz = {'alg': {}, 'correlation': None, 'random': {'scatter': None, 'histogram': None}}
-
-        if do_plots:
-            alloc = optimizer.plot_portfolio_allocation()
-            rc    = optimizer.plot_risk_contributions()
-            cr    = optimizer.plot_cumulative_returns()
-            corr  = optimizer.plot_correlation_matrix()
-            rand, hist = optimizer.simulate_random_portfolios()
-
-            # per-method images
-            for name in alloc.keys():
-                alloc_file = f"{name}_alloc_{run_id}.png"
-                risk_file  = f"{name}_risk_{run_id}.png"
-                cum_file   = f"{name}_cum_{run_id}.png"
-                save_fig(alloc[name], os.path.join(PLOT_DIR, alloc_file))
-                save_fig(rc[name],    os.path.join(PLOT_DIR, risk_file))
-                save_fig(cr[name],    os.path.join(PLOT_DIR, cum_file))
-                viz['alg'][name] = {
-                    'allocation': url_for('static', filename=f'plots/{alloc_file}'),
-                    'risk':       url_for('static', filename=f'plots/{risk_file}'),
-                    'cumulative': url_for('static', filename=f'plots/{cum_file}')
-                }
-
-            # correlation & random
-            corr_file = f"corr_{run_id}.png"
-            rand_file = f"rand_{run_id}.png"
-            hist_file = f"hist_{run_id}.png"
-            save_fig(corr, os.path.join(PLOT_DIR, corr_file))
-            save_fig(rand, os.path.join(PLOT_DIR, rand_file))
-            save_fig(hist, os.path.join(PLOT_DIR, hist_file))
-            viz['correlation'] = url_for('static', filename=f'plots/{corr_file}')
-            viz['random'] = {
-                'scatter':    url_for('static', filename=f'plots/{rand_file}'),
-                'histogram':  url_for('static', filename=f'plots/{hist_file}')
-            }
-
-
-        # — 3. Backtesting —
-        back = {}
-        if do_backtest and days >= MIN_BACKTEST_DAYS:
-            for name, key, _ in strategies:
-                pr, cr, stats, fig = optimizer.backtest_portfolio(
-                    data.index[0], data.index[-1],
-                    train_window=252, rebalance_period=63,
-                    optimization_method=key,
-                    transaction_cost=0.001
-                )
-                # stats[key] is a dict of metrics
-                method_stats = stats[key]
-                back[name] = {
-                    'Total Return':        round(method_stats['Total Return'], 2),
-                    'Annualized Return':   round(method_stats['Annualized Return'], 2),
-                    'Annualized Volatility': round(method_stats['Annualized Volatility'], 2),
-                    'Sharpe Ratio':        round(method_stats['Sharpe Ratio'], 2),
-                    'Maximum Drawdown':    round(method_stats['Maximum Drawdown'], 2)
-                }
-
-        # — 4. Sensitivity Analysis —
-        sens = {}
-        if do_sensitivity and days >= MIN_SENSITIVITY_DAYS:
-            for name, key, _ in strategies:
-                df = optimizer.sensitivity_analysis(
-                    train_windows=[252, 126],
-                    rebalance_periods=[63, 21],
-                    optimization_method=key
-                )
-                sens[name] = {
-                    'Train Window':         df['Train Window'],
-                    'Rebalance Period':     df['Rebalance Period'],
-                    'Annualized Return':    [float(f"{v:.3f}") for v in df['Annualized Return']],
-                    'Annualized Volatility':[float(f"{v:.3f}") for v in df['Annualized Volatility']],
-                    'Sharpe Ratio':         [float(f"{v:.3f}") for v in df['Sharpe Ratio']],
-                    'Max Drawdown':         [float(f"{v:.3f}") for v in df['Max Drawdown']]
-                }
-
-
-        return render_template(
-            'results.html',
-            title='Portfolio Optimization Analysis Report',
-            generated=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            opt=opt,
-            viz=viz,
-            back=back,
-            sens=sens,
-            days=days,
-            min_back=MIN_BACKTEST_DAYS,
-            min_sens=MIN_SENSITIVITY_DAYS
-        )
+        params = {
+            'tickers': request.form['tickers'].split(),
+            'start': request.form['start'],
+            'end': request.form['end'],
+            'riskfree': float(request.form['riskfree']),
+            'plots': 'plots' in request.form,
+            'backtest': 'backtest' in request.form,
+            'sensitivity': 'sensitivity' in request.form,
+            'render': 'interactive' if request.form.get('render') == 'interactive' else 'png'
+        }
+        job_id = JOBS.submit(run_analysis, params)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'job_id': job_id, 'status': url_for('job_status', job_id=job_id)}), 202
+        return render_template('job.html', job_id=job_id), 202
 
     # GET → show form
     return render_template('index.html')
 
 
-def get_description(key):
-    return {
-        'Maximum Sharpe Ratio':    'Optimizes the Sharpe ratio for best return per unit risk.',
-        'Minimum Volatility':       'Minimizes portfolio volatility.',
-        'Hierarchical Risk Parity': 'Clusters assets and allocates risk evenly.',
-        'Equal Risk Contribution':  'Balances risk contribution among assets.',
-        'Equal Weight':             'Assigns equal weight to each asset.',
-        'Maximum Diversification':  'Maximizes diversification ratio.',
-        'Minimum CVaR':             'Minimizes potential tail losses (CVaR).'
-    }.get(key, '')
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    status = JOBS.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+    if status['state'] == 'done':
+        status['result'] = url_for('job_result', job_id=job_id)
+    return jsonify(status)
+
+
+@app.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    status = JOBS.status(job_id)
+    if status is None:
+        return render_template('job.html', job_id=job_id, error='Unknown job.'), 404
+    if status['state'] == 'failed':
+        return render_template('job.html', job_id=job_id, error=status['error']), 500
+    if status['state'] != 'done':
+        return redirect(url_for('job_page', job_id=job_id))
+    result = JOBS.result(job_id)
+    return render_template(
+        'results.html',
+        title='Portfolio Optimization Analysis Report',
+        generated=result['generated'],
+        opt=result['opt'],
+        viz=_static_urls(result['viz']),
+        back=result['back'],
+        sens=result['sens'],
+        days=result['days'],
+        min_back=MIN_BACKTEST_DAYS,
+        min_sens=MIN_SENSITIVITY_DAYS
+    )
+
+
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def _record_latency(response):
+    if 'request_start' in g:
+        PROFILER.record(f"http:{request.endpoint or 'unknown'}", time.perf_counter() - g.request_start,
+                        errors=int(response.status_code >= 500))
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    # Stage timings are per process: with JOB_BACKEND=process the analysis stages run (and are counted) in workers.
+    return jsonify(PROFILER.snapshot())
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(RESULTS.stats())
+
+
+@app.route('/jobs/<job_id>/view')
+def job_page(job_id):
+    if JOBS.status(job_id) is None:
+        return render_template('job.html', job_id=job_id, error='Unknown job.'), 404
+    return render_template('job.html', job_id=job_id)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,179 @@
+"""
+Module: benchmark.py
+
+Purpose:
+    Offline end-to-end benchmarks for the optimizers, backtests, simulations and figure rendering. Synthetic daily
+    returns shaped like sample.csv (a Date index and Asset1..AssetN columns) are generated for every requested
+    (assets, days) case, each stage is timed, and the results are appended to a JSON history together with the git
+    commit so that a run can be compared with the previous one and regressions flagged.
+
+Usage:
+    python benchmark.py                                   # full matrix: N in {10, 100, 1000} x T in {500, 5000}
+    python benchmark.py --assets 10 100 --days 500 --repeat 3
+    python benchmark.py --fail-on-regression --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from utils.portfolio_optimizer import PortfolioOptimizer
+from utils.strategies import STRATEGIES
+from utils.utilities import save_fig
+
+
+def synthetic_returns(num_assets, num_days, seed=0):
+    """One-factor daily returns with sample.csv's layout: business-day Date index and Asset1..AssetN columns."""
+    rng = np.random.default_rng(seed)
+    market = rng.normal(0.0004, 0.01, num_days)
+    beta = rng.uniform(0.5, 1.5, num_assets)
+    drift = rng.normal(0.0002, 0.0002, num_assets)
+    idio = rng.normal(0.0, 1.0, (num_days, num_assets)) * rng.uniform(0.005, 0.02, num_assets)
+    values = drift + np.outer(market, beta) + idio
+    index = pd.bdate_range('2000-01-03', periods=num_days, name='Date')
+    return pd.DataFrame(values, index=index, columns=[f"Asset{i + 1}" for i in range(num_assets)])
+
+
+def _time(func, repeat):
+    """Best wall time over `repeat` calls, with the status of the last one."""
+    best, status = float('inf'), 'ok'
+    for _ in range(repeat):
+        start = time.perf_counter()
+        try:
+            result = func()
+            if result is False:
+                status = 'failed'
+        except Exception as e:
+            status = f"error: {type(e).__name__}: {e}"
+        best = min(best, time.perf_counter() - start)
+    return best, status
+
+
+def run_case(num_assets, num_days, repeat, heavy_max_assets):
+    data = synthetic_returns(num_assets, num_days)
+    optimizer = PortfolioOptimizer(data, risk_free_rate=0.01)
+    stages = {}
+
+    def record(name, func):
+        seconds, status = _time(func, repeat)
+        stages[name] = {'seconds': seconds, 'status': status}
+        print(f"  {name:<32} {seconds:>9.4f}s  {status}")
+
+    record('moments', lambda: (optimizer.invalidate_moments(), optimizer.moments))
+    for key, strategy in STRATEGIES.items():
+        record(f"strategy:{key}", lambda strategy=strategy: strategy.run(optimizer))
+    optimizer.equal_weight()
+    optimizer.add_weights('Equal Weight')
+
+    # Walk-forward stages re-run the optimizers on every window, so they are limited to moderate universes.
+    if num_assets <= heavy_max_assets:
+        train_window, rebalance_period = min(252, num_days // 3), min(63, num_days // 8)
+        record('backtest_portfolio', lambda: optimizer.backtest_portfolio(
+            data.index[0], data.index[-1], train_window=train_window, rebalance_period=rebalance_period,
+            optimization_method='min_vol', transaction_cost=0.001))
+        record('sensitivity_analysis', lambda: optimizer.sensitivity_analysis(
+            train_windows=[train_window, train_window // 2], rebalance_periods=[rebalance_period,
+                                                                                rebalance_period // 3],
+            optimization_method='min_vol'))
+    record('simulate_random_portfolios', lambda: optimizer.simulate_random_portfolios())
+
+    fig = optimizer.plot_cumulative_returns()['Equal Weight']
+    with tempfile.TemporaryDirectory() as tmp:
+        record('save_fig', lambda: save_fig(fig, os.path.join(tmp, 'figure.png')))
+    return stages
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.realpath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(previous, current, threshold, min_seconds):
+    """Stages that got slower than previous by more than `threshold` (relative) and `min_seconds` (absolute)."""
+    regressions = []
+    for case, stages in current['results'].items():
+        for stage, now in stages.items():
+            before = previous['results'].get(case, {}).get(stage)
+            if before is None or before['status'] != 'ok' or now['status'] != 'ok':
+                continue
+            if now['seconds'] > before['seconds'] * (1 + threshold) and \
+                    now['seconds'] - before['seconds'] > min_seconds:
+                regressions.append((case, stage, before['seconds'], now['seconds']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the PortfolioOptimizer framework")
+    parser.add_argument("--assets", type=int, nargs="+", default=[10, 100, 1000],
+                        help="Universe sizes to benchmark (default: 10 100 1000)")
+    parser.add_argument("--days", type=int, nargs="+", default=[500, 5000],
+                        help="History lengths in trading days (default: 500 5000)")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Repetitions per stage; the best time is kept (default: 1)")
+    parser.add_argument("--heavy-max-assets", type=int, default=100,
+                        help="Largest universe for backtest and sensitivity stages (default: 100)")
+    parser.add_argument("--history", type=str, default=".benchmarks/history.json",
+                        help="JSON history file (default: .benchmarks/history.json)")
+    parser.add_argument("--no-save", action="store_true",
+                        help="Compare with the history without appending this run")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Relative slowdown reported as a regression (default: 0.25)")
+    parser.add_argument("--min-seconds", type=float, default=0.01,
+                        help="Ignore slowdowns smaller than this many seconds (default: 0.01)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="Exit with status 1 when a regression is found")
+    args = parser.parse_args()
+
+    run = {
+        'commit': _git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': {}
+    }
+    for num_assets in args.assets:
+        for num_days in args.days:
+            case = f"N={num_assets},T={num_days}"
+            print(case)
+            run['results'][case] = run_case(num_assets, num_days, args.repeat, args.heavy_max_assets)
+
+    history = []
+    if os.path.exists(args.history):
+        with open(args.history) as f:
+            history = json.load(f)
+
+    regressions = compare(history[-1], run, args.threshold, args.min_seconds) if history else []
+    if history:
+        print(f"\nCompared with {history[-1]['commit']} ({history[-1]['timestamp']}):")
+        for case, stage, before, now in regressions:
+            print(f"  REGRESSION {case} {stage}: {before:.4f}s -> {now:.4f}s ({now / before - 1:+.0%})")
+        if not regressions:
+            print("  no regressions")
+
+    if not args.no_save:
+        history.append(run)
+        os.makedirs(os.path.dirname(os.path.abspath(args.history)), exist_ok=True)
+        tmp = f"{args.history}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(history, f, indent=2)
+        os.replace(tmp, args.history)
+        print(f"Results appended to {args.history}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,24 @@
 import os
 import argparse
+import copy
+import cProfile
+import tracemalloc
 import pandas as pd
 from collections import defaultdict
 from utils.portfolio_optimizer import PortfolioOptimizer
+from utils.covariance import ESTIMATORS, get_estimator
+from utils.strategies import STRATEGIES
 from utils.llm import generate_insights
 from utils.tickers import TickerData
-from utils.utilities import save_fig
+from utils.price_cache import PriceCache
+from utils.rendering import render_figures, render_report
 from utils.report import generate_report
+from utils.instrumentation import PROFILER
+from utils.stages import StageFailed, StageGraph
 from datetime import date
 from dateutil.relativedelta import relativedelta
 
 def main():
-    dir = os.path.dirname(os.path.realpath(__file__))
-    os.makedirs("plots", exist_ok=True)
-    
-    datares = defaultdict(dict)
     parser = argparse.ArgumentParser(
         description="Portfolio Optimization and Management using PortfolioOptimizer Framework"
     )
@@ -52,6 +56,29 @@ def main():
         action="store_true",
         help="Run sensitivity analysis on training and rebalance window parameters"
     )
+    parser.add_argument(
+        "--cache-dir",
+        type=str,
+        default=".price_cache",
+        help="Directory of the local price cache used with --tickers (default: .price_cache)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Download prices directly instead of going through the local price cache"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes for the sensitivity grid (default: number of CPUs, 1 runs serially)"
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=None,
+        help="Processes used to render plot images (default: up to 4, 1 renders in this process)"
+    )
     parser.add_argument(
         "--llm",
         action="store_true",
@@ -68,135 +95,260 @@ def main():
         help="End date for data retrieval (required if --tickers is provided)"
     )
     
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Stages run concurrently once their inputs are ready (default: 1, sequential)"
+    )
+    parser.add_argument(
+        "--stage-backend",
+        choices=["thread", "process"],
+        default="thread",
+        help="Pool used for concurrent stages (default: thread)"
+    )
+    parser.add_argument(
+        "--stage-cache",
+        type=str,
+        default=".stage-cache",
+        help="Directory of cached stage results; unchanged stages are skipped on rerun (default: .stage-cache)"
+    )
+    parser.add_argument(
+        "--no-stage-cache",
+        action="store_true",
+        help="Run every stage instead of reusing cached results"
+    )
+    parser.add_argument(
+        "--cov",
+        choices=ESTIMATORS,
+        default="sample",
+        help="Covariance estimator: sample, Ledoit-Wolf or OAS shrinkage, EWMA, or a PCA factor model (default: sample)"
+    )
+    parser.add_argument(
+        "--halflife",
+        type=int,
+        default=63,
+        help="Half-life in trading days of the EWMA estimator (default: 63)"
+    )
+    parser.add_argument(
+        "--factors",
+        type=int,
+        default=5,
+        help="Number of factors of the factor-model estimator (default: 5)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Store returns as float32 without copies to reduce memory on large universes"
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Trace allocations and add each stage's peak memory to the --profile breakdown (slower)"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a per-stage timing breakdown (data, optimizers, backtests, sensitivity, rendering) at the end"
+    )
+    parser.add_argument(
+        "--cprofile",
+        type=str,
+        metavar="PATH",
+        help="Also run under cProfile and write the stats to PATH (inspect with python -m pstats PATH)"
+    )
+    
     args = parser.parse_args()
 
-    if args.data:
-        try:
-            data = pd.read_csv(args.data, index_col=0, parse_dates=True)
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return
-    elif args.tickers:
-        if not args.start or not args.end:    
-            args.end = date.today()
-            args.start = (args.end - relativedelta(years=2))
-
-            args.start = args.start.strftime('%Y-%m-%d')
-            args.end = args.end.strftime('%Y-%m-%d')
-
-        try:
-            tick=TickerData(args.tickers, args.start, args.end)
-            data = tick.ticker_data()
-        except Exception as e:
-            print(f"Error loading data: {e}")
-            return
-
-    optimizer = PortfolioOptimizer(data, risk_free_rate=args.riskfree)
-
-    # ---------------------------
-    # Run Various Optimizations
-    # ---------------------------
-    '''Maximum Sharpe Ratio Optimization'''
-    ms_weights, ms_ret, ms_vol = optimizer.maximize_sharpe_ratio()
-    optimizer.add_weights('Maximum Sharpe Ratio')
-    datares['Maximum Sharpe Ratio']['Weights'] = ms_weights
-    datares['Maximum Sharpe Ratio']['Annualized Return'] = ms_ret
-    datares['Maximum Sharpe Ratio']['Annualized Volatility'] = ms_vol
-
-    '''Minimum Volatility Optimization'''
-    mv_weights, mv_ret, mv_vol = optimizer.minimize_volatility()
-    optimizer.add_weights('Minimum Volatility')
-    datares['Minimum Volatility']['Weights'] = mv_weights
-    datares['Minimum Volatility']['Annualized Return'] = mv_ret
-    datares['Minimum Volatility']['Annualized Volatility'] = mv_vol
-
-    '''Hierarchical Risk Parity (HRP) Optimization'''
-    hrp_weights, hrp_ret, hrp_vol = optimizer.hierarchical_risk_parity()
-    optimizer.add_weights('Hierarchical Risk Parity')
-    datares['Hierarchical Risk Parity']['Weights'] = hrp_weights
-    datares['Hierarchical Risk Parity']['Annualized Return'] = hrp_ret
-    datares['Hierarchical Risk Parity']['Annualized Volatility'] = hrp_vol
-
-    '''Equal Risk Contribution (ERC) Optimization'''
-    erc_weights, erc_ret, erc_vol = optimizer.equal_risk_contribution()
-    optimizer.add_weights('Equal Risk')
-    datares['Equal Risk']['Weights'] = erc_weights
-    datares['Equal Risk']['Annualized Return'] = erc_ret
-    datares['Equal Risk']['Annualized Volatility'] = erc_vol
-
-    '''Equal Weight Portfolio'''
-    eq_weights, eq_ret, eq_vol = optimizer.equal_weight()
-    optimizer.add_weights('Equal Weight')
-    datares['Equal Weight']['Weights'] = eq_weights
-    datares['Equal Weight']['Annualized Return'] = eq_ret
-    datares['Equal Weight']['Annualized Volatility'] = eq_vol
-
-    '''Maximum Diversification Optimization'''
-    md_weights, md_ret, md_vol = optimizer.maximum_diversification()
-    optimizer.add_weights('Maximum Diversification')
-    datares['Maximum Diversification']['Weights'] = md_weights
-    datares['Maximum Diversification']['Annualized Return'] = md_ret
-    datares['Maximum Diversification']['Annualized Volatility'] = md_vol
-
-    '''Minimum CVaR Optimization'''
-    mcvar_weights, mcvar_ret, mcvar_vol = optimizer.minimize_cvar(alpha=0.05)
-    optimizer.add_weights('Minimum CVaR')
-    datares['Minimum CVaR']['Weights'] = mcvar_weights
-    datares['Minimum CVaR']['Annualized Return'] = mcvar_ret
-    datares['Minimum CVaR']['Annualized Volatility'] = mcvar_vol
-
-    '''Backtesting'''
-    if args.backtest:
-        for i in ['max_sharpe', 'min_vol', 'HRP', 'ERC', 'Eq', 'max_div', 'min_cvar']:
-            results = optimizer.backtest_portfolio(
-                start_date=data.index[0],
-                end_date=data.index[-1],
-                train_window=252,
-                rebalance_period=63,
-                optimization_method=i,
-                transaction_cost=0.001,)
-            datares['backtesting'][i] = results[2]
-            save_fig(results[3], f"plots/{i}_backtest.png")
-
-
-    '''Visualization'''
-    if args.plots:
-        #ef=optimizer.plot_efficient_frontier()
-        pa=optimizer.plot_portfolio_allocation()
-        rc=optimizer.plot_risk_contributions()
-        cr=optimizer.plot_cumulative_returns()
-        cm=optimizer.plot_correlation_matrix()
-        sdr=optimizer.simulate_random_portfolios()
-
-        #save_fig(ef, "plots/efficient_frontier.png")
-
-        for i in pa.keys():
-            save_fig(pa[i], f"plots/{i}_portfolio_allocation.png")
-        for i in rc.keys():
-            save_fig(rc[i], f"plots/{i}_risk_contributions.png")
-        for i in cr.keys():
-            save_fig(cr[i], f"plots/{i}_cumulative_returns.png")
-        save_fig(cm, f"plots/correl_mat.png")
-        save_fig(sdr[0], "plots/simulate_random_portfolios.png")
-        save_fig(sdr[1], "plots/distribution_sharpe_ratios.png")
-        
-    '''Sensitivity'''
-    if args.sensitivity:
-        for i in ['max_sharpe', 'min_vol', 'HRP', 'ERC', 'Eq', 'max_div', 'min_cvar']:
-            sens = optimizer.sensitivity_analysis(
-                train_windows=[252, 126],
-                rebalance_periods=[63, 21],
-                optimization_method=i
-            )
-            datares['Sensitivity Analysis'][i] = sens
+    profiler = cProfile.Profile() if args.cprofile else None
+    if profiler is not None:
+        profiler.enable()
+    if args.memory:
+        tracemalloc.start()
+    try:
+        run(args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.cprofile)
+            print(f"cProfile stats written to {args.cprofile}")
+        if args.profile:
+            print(PROFILER.report())
+
+
+# Report labels that differ from the strategy names (report.py looks the ERC section up as 'Equal Risk').
+REPORT_LABELS = {'ERC': 'Equal Risk'}
+
+
+def _label(key):
+    return REPORT_LABELS.get(key, STRATEGIES[key].name)
+
+
+def load_stage(data_path=None, tickers=None, start=None, end=None, cache_dir=None):
+    if data_path:
+        return pd.read_csv(data_path, index_col=0, parse_dates=True)
+    cache = PriceCache(cache_dir) if cache_dir else None
+    data = TickerData(tickers, start, end, cache=cache).ticker_data()
+    if isinstance(data, str):
+        raise ValueError(data)
+    return data
+
+
+def moments_stage(data, riskfree, compact=False, cov='sample', halflife=63, factors=5):
+    optimizer = PortfolioOptimizer(data, risk_free_rate=riskfree, compact=compact,
+                                   cov_estimator=get_estimator(cov, halflife=halflife, factors=factors))
+    optimizer.moments
+    return optimizer
+
+
+def optimize_stage(optimizer, key):
+    # Strategies store weights and solver_info on the optimizer, so concurrent stages each work on a shallow copy
+    # that shares the cached moments.
+    optimizer = copy.copy(optimizer)
+    return STRATEGIES[key].run(optimizer)
+
+
+def _with_weights(optimizer, opt_results):
+    optimizer = copy.copy(optimizer)
+    optimizer.weight_list = {}
+    for key, (weights, _, _) in opt_results.items():
+        optimizer.weights = weights
+        optimizer.add_weights(_label(key))
+    return optimizer
+
+
+def plots_stage(optimizer, *opt_results, keys):
+    optimizer = _with_weights(optimizer, dict(zip(keys, opt_results)))
+    ef=optimizer.plot_efficient_frontier()
+    pa=optimizer.plot_portfolio_allocation()
+    rc=optimizer.plot_risk_contributions()
+    cr=optimizer.plot_cumulative_returns()
+    cm=optimizer.plot_correlation_matrix()
+    sdr=optimizer.simulate_random_portfolios()
+
+    figures = [(ef, "plots/efficient_frontier.png")]
+    for i in pa.keys():
+        figures.append((pa[i], f"plots/{i}_portfolio_allocation.png"))
+    for i in rc.keys():
+        figures.append((rc[i], f"plots/{i}_risk_contributions.png"))
+    for i in cr.keys():
+        figures.append((cr[i], f"plots/{i}_cumulative_returns.png"))
+    figures.append((cm, f"plots/correl_mat.png"))
+    figures.append((sdr[0], "plots/simulate_random_portfolios.png"))
+    figures.append((sdr[1], "plots/distribution_sharpe_ratios.png"))
+    return {'figures': figures}
+
+
+def backtest_stage(optimizer, methods):
+    data = optimizer.returns
+    results = optimizer.backtest_many(
+        start_date=data.index[0],
+        end_date=data.index[-1],
+        methods=methods,
+        train_window=252,
+        rebalance_period=63,
+        transaction_cost=0.001,)
+    stats = {i: results.stats[i] for i in results.methods}
+    figures = [(results.figure(i), f"plots/{i}_backtest.png") for i in results.methods]
+    return {'stats': stats, 'figures': figures}
+
+
+def sensitivity_stage(optimizer, methods, workers=None):
+    return optimizer.sensitivity_grid(
+        methods=methods,
+        train_windows=[252, 126],
+        rebalance_periods=[63, 21],
+        max_workers=workers
+    )
+
+
+def render_stage(*stage_results, render_workers=None):
+    figures = [job for result in stage_results for job in result['figures']]
+    records = render_figures(figures, processes=render_workers)
+    print(render_report(records))
+    return records
+
+
+def report_stage(*results, keys, backtest, sensitivity, llm, tickers):
+    datares = defaultdict(dict)
+    results = list(results)
+    for key in keys:
+        weights, ret, vol = results.pop(0)
+        label = _label(key)
+        datares[label]['Weights'] = weights
+        datares[label]['Annualized Return'] = ret
+        datares[label]['Annualized Volatility'] = vol
+    if backtest:
+        stats = results.pop(0)['stats']
+        for i in stats:
+            datares['backtesting'][i] = {i: stats[i]}
+    if sensitivity:
+        sens = results.pop(0)
+        for i in sens.keys():
+            datares['Sensitivity Analysis'][i] = sens[i]
 
     '''LLM Analysis using GPT O3 Mini'''
-    if args.llm:
+    if llm:
         insights = generate_insights(datares)
         '''include insights in final report'''
     else:
         '''create final report without llm'''
-        generate_report(datares, args.tickers)
+        generate_report(datares, tickers)
+
+
+def run(args):
+    os.makedirs("plots", exist_ok=True)
+
+    if args.tickers and (not args.start or not args.end):
+        args.end = date.today()
+        args.start = (args.end - relativedelta(years=2))
+
+        args.start = args.start.strftime('%Y-%m-%d')
+        args.end = args.end.strftime('%Y-%m-%d')
+
+    # load -> moments -> opt:<key> -> {plots, backtests, sensitivity} -> render -> report
+    graph = StageGraph()
+    methods = list(STRATEGIES)
+    opt_stages = [f"opt:{key}" for key in methods]
+    graph.add('load', load_stage, cache=False, params={
+        'data_path': args.data, 'tickers': args.tickers, 'start': args.start, 'end': args.end,
+        'cache_dir': None if args.no_cache else args.cache_dir})
+    graph.add('moments', moments_stage, deps=['load'], params={
+        'riskfree': args.riskfree, 'compact': args.compact, 'cov': args.cov, 'halflife': args.halflife,
+        'factors': args.factors})
+    for key, stage in zip(methods, opt_stages):
+        graph.add(stage, optimize_stage, deps=['moments'], params={'key': key})
+    figure_stages = []
+    if args.plots:
+        graph.add('plots', plots_stage, deps=['moments'] + opt_stages, params={'keys': methods})
+        figure_stages.append('plots')
+    if args.backtest:
+        graph.add('backtests', backtest_stage, deps=['moments'], params={'methods': methods})
+        figure_stages.append('backtests')
+    if args.sensitivity:
+        graph.add('sensitivity', sensitivity_stage, deps=['moments'], params={'methods': methods},
+                  options={'workers': args.workers})
+    if figure_stages:
+        graph.add('render', render_stage, deps=figure_stages, cache=False,
+                  options={'render_workers': args.render_workers})
+    # Backtest figures travel with their stats; the report only reads the stats.
+    report_deps = opt_stages + (['backtests'] if args.backtest else []) + \
+        (['sensitivity'] if args.sensitivity else []) + (['render'] if figure_stages else [])
+    graph.add('report', report_stage, deps=report_deps, cache=False, params={
+        'keys': methods, 'backtest': args.backtest, 'sensitivity': args.sensitivity, 'llm': args.llm,
+        'tickers': args.tickers})
+
+    try:
+        graph.run(jobs=args.jobs, backend=args.stage_backend,
+                  cache_dir=None if args.no_stage_cache else args.stage_cache)
+    except StageFailed as e:
+        if e.stage != 'load':
+            raise
+        print(f"Error loading data: {e.__cause__}")
+    finally:
+        if args.profile:
+            for name, status, seconds in graph.log:
+                print(f"  stage {name:<20} {status:<7} {seconds:.3f}s")
 
 
 if __name__ == "__main__":
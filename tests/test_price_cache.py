@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+from utils.price_cache import FrameProvider, PriceCache
+
+
+def _prices():
+    index = pd.bdate_range('2020-04-01', '2020-06-30')
+    return pd.DataFrame({'AAPL': np.arange(len(index)) + 100.0, 'MSFT': np.arange(len(index)) + 200.0},
+                        index=index)
+
+
+def test_weekend_start_is_served_from_cache(tmp_path):
+    # 2020-04-12 is a Sunday: the range is covered once bars come back, so a rerun makes no provider call.
+    provider = FrameProvider(_prices())
+    cache = PriceCache(str(tmp_path), provider)
+    first = cache.get(['AAPL', 'MSFT'], '2020-04-12', '2020-06-01')
+    assert len(provider.calls) == 1
+    for _ in range(3):
+        again = cache.get(['AAPL', 'MSFT'], '2020-04-12', '2020-06-01')
+        pd.testing.assert_frame_equal(again, first)
+    assert len(provider.calls) == 1
+
+
+def test_failed_download_is_fetched_again(tmp_path):
+    class FlakyProvider(FrameProvider):
+        def fetch(self, tickers, start, end):
+            prices = super().fetch(tickers, start, end)
+            return prices * np.nan if len(self.calls) == 1 else prices
+
+    provider = FlakyProvider(_prices())
+    cache = PriceCache(str(tmp_path), provider)
+    assert cache.get(['AAPL'], '2020-04-12', '2020-06-01')['AAPL'].isna().all()
+    assert cache.get(['AAPL'], '2020-04-12', '2020-06-01')['AAPL'].notna().any()
+    assert len(provider.calls) == 2
+
+
+def test_symbols_are_upper_cased_and_deduplicated(tmp_path):
+    provider = FrameProvider(_prices())
+    cache = PriceCache(str(tmp_path), provider)
+    prices = cache.get(['aapl', 'AAPL', 'msft'], '2020-04-12', '2020-06-01')
+    assert list(prices.columns) == ['AAPL', 'MSFT']
+    assert prices.notna().all().all()
@@ -0,0 +1,123 @@
+"""
+Module: artifacts.py
+
+Purpose:
+    Stores rendered plot images under content-addressed names so that identical figures are rendered and stored
+    once, and keeps the directory bounded by evicting files by age and total size.
+
+Classes:
+    ArtifactStore:
+        Constructor:
+            - __init__(root, max_bytes, max_age, sweep_interval):
+                  Uses `root` as the image directory. Files older than max_age seconds are removed, then the least
+                  recently used files until the directory holds at most max_bytes. A positive sweep_interval starts
+                  a background thread that sweeps periodically.
+        Methods:
+            - key(fig, fmt):
+                  Returns the SHA-256 of the figure spec and output format.
+            - save(fig, fmt):
+                  Renders the figure through save_fig unless an image with the same key already exists, and returns
+                  the file name relative to `root` (or None if rendering failed).
+            - sweep():
+                  Applies the age and size limits once and returns the number of files removed.
+            - start_sweeper(interval) / stop_sweeper():
+                  Starts or stops the background sweeper thread.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from .utilities import save_fig
+
+
+class ArtifactStore:
+    def __init__(self, root, max_bytes=256 * 2**20, max_age=7 * 24 * 3600, sweep_interval=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        os.makedirs(root, exist_ok=True)
+        self._stop = threading.Event()
+        self._thread = None
+        if sweep_interval:
+            self.start_sweeper(sweep_interval)
+
+    def key(self, fig, fmt='png'):
+        digest = hashlib.sha256(fig.to_json().encode())
+        digest.update(fmt.encode())
+        return digest.hexdigest()
+
+    def save(self, fig, fmt='png'):
+        name = f"{self.key(fig, fmt)}.{fmt}"
+        path = os.path.join(self.root, name)
+        if os.path.exists(path):
+            # Refresh the access time used by the size-based eviction.
+            try:
+                os.utime(path)
+                return name
+            except OSError:
+                pass
+        tmp = os.path.join(self.root, f".{name}.{os.getpid()}.{threading.get_ident()}.{fmt}")
+        if not save_fig(fig, tmp):
+            return None
+        os.replace(tmp, path)
+        return name
+
+    def _files(self):
+        files, partial = [], []
+        for entry in os.scandir(self.root):
+            if entry.is_file():
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                # Dot-prefixed files are renders in progress (or left behind by a crashed one).
+                (partial if entry.name.startswith('.') else files).append((stat.st_mtime, stat.st_size, entry.path))
+        return files, partial
+
+    def sweep(self):
+        removed = 0
+        files, partial = self._files()
+        now = time.time()
+        for mtime, _, path in partial:
+            if now - mtime > 3600:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in files:
+            expired = self.max_age is not None and now - mtime > self.max_age
+            oversized = self.max_bytes is not None and total > self.max_bytes
+            if not (expired or oversized):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def _run_sweeper(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except OSError as e:
+                print(f"Artifact sweep failed for {self.root}: {e}")
+
+    def start_sweeper(self, interval=300):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run_sweeper, args=(interval,), daemon=True,
+                                        name='artifact-sweeper')
+        self._thread.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -2,137 +2,209 @@ import pandas as pd
 import numpy as np
 from collections import defaultdict
 import plotly.graph_objects as go
+from .rolling import RollingMoments
+from .strategies import STRATEGIES, get_strategy
+from .parallel import run_cells
+from .downsample import DEFAULT_MAX_POINTS, downsample_figure
+from .instrumentation import instrument
 
-class BacktestingMixin:
-    def backtest_portfolio(self, start_date, end_date, train_window=252, rebalance_period=63,
-                           optimization_method="None", transaction_cost=0.0, benchmark=None):
-        """Backtest the portfolio using a rolling window approach and return a Plotly figure of cumulative returns."""
-        datadic = defaultdict(dict)
-        bt_data = self.returns.loc[start_date:end_date]
-        n = bt_data.shape[0]
-        portfolio_returns_list = []
-        self.weight_history = {}
-        prev_weights = None
 
-        i = 0
-        while i + train_window < n:
-            train_data = bt_data.iloc[i : i + train_window]
-            optimizer_train = self.__class__(train_data, risk_free_rate=self.risk_free_rate)
-            optimizer_train.cov_matrix = self.cov_matrix.loc[train_data.columns, train_data.columns]
-            
-            if optimization_method == "max_sharpe":
-                weights, _, _ = optimizer_train.maximize_sharpe_ratio()
-            elif optimization_method == "min_vol":
-                weights, _, _ = optimizer_train.minimize_volatility()
-            elif optimization_method == "HRP":
-                weights, _, _ = optimizer_train.hierarchical_risk_parity()
-            elif optimization_method == "ERC":
-                weights, _, _ = optimizer_train.equal_risk_contribution()
-            elif optimization_method == "Eq":
-                weights, _, _ = optimizer_train.equal_weight()
-            elif optimization_method == "max_div":
-                weights, _, _ = optimizer_train.maximum_diversification()
-            elif optimization_method == "min_cvar":
-                weights, _, _ = optimizer_train.minimize_cvar()
-            else:
-                raise ValueError("Unsupported optimization method.")
-
-            if prev_weights is not None:
-                turnover = self.calculate_turnover(prev_weights, weights)
-                cost_adjustment = 1 - (turnover * transaction_cost)
-            else:
-                cost_adjustment = 1.0
-
-            rebal_date = bt_data.index[i + train_window - 1]
-            self.weight_history[rebal_date] = weights
+def _backtest_stats(portfolio_returns, risk_free_rate):
+    """Summary statistics of a backtested daily return series."""
+    ann_vol = portfolio_returns.std() * np.sqrt(252)
+    ann_return = portfolio_returns.mean() * 252
+    sharpe = (ann_return - risk_free_rate) / ann_vol
 
-            test_start = i + train_window
-            test_end = min(i + train_window + rebalance_period, n)
-            test_data = bt_data.iloc[test_start:test_end]
-            p_returns = test_data.dot(weights) * cost_adjustment
-            portfolio_returns_list.append(p_returns)
-            prev_weights = weights
-            i = test_end
+    cum_val = (1 + portfolio_returns).cumprod()
+    roll_max = cum_val.cummax()
+    drawdown = (cum_val - roll_max) / roll_max
+    return {
+        'Total Return': cum_val.iloc[-1] - 1,
+        'Annualized Return': ann_return,
+        'Annualized Volatility': ann_vol,
+        'Sharpe Ratio': sharpe,
+        'Maximum Drawdown': drawdown.min()
+    }
 
-        # Check if any test returns were generated
-        if not portfolio_returns_list:
-            raise ValueError("No test data generated during backtest. "
-                             "Check if your dataset has enough rows for the given train_window and rebalance_period.")
 
-        portfolio_returns = pd.concat(portfolio_returns_list).sort_index()
-        cumulative_returns = (1 + portfolio_returns).cumprod() - 1
+class BacktestResult:
+    """Per-strategy returns, weight histories and statistics produced by one walk-forward pass."""
 
-        ann_vol = portfolio_returns.std() * np.sqrt(252)
-        ann_return = portfolio_returns.mean() * 252
-        sharpe = (ann_return - self.risk_free_rate) / ann_vol
+    def __init__(self, returns, weight_history, risk_free_rate, max_points=DEFAULT_MAX_POINTS):
+        self.methods = list(returns)
+        self.max_points = max_points
+        self.returns = returns
+        self.weight_history = weight_history
+        self.cumulative = {m: (1 + r).cumprod() - 1 for m, r in returns.items()}
+        self.stats = {m: _backtest_stats(r, risk_free_rate) for m, r in returns.items()}
 
-        cum_val = (1 + portfolio_returns).cumprod()
-        roll_max = cum_val.cummax()
-        drawdown = (cum_val - roll_max) / roll_max
-        max_drawdown = drawdown.min()
+    def figure(self, method, benchmark=None, max_points=None):
+        """Plotly figure of the cumulative portfolio value of one strategy, optionally against a benchmark.
 
-        # Create Plotly figure for cumulative returns
+        Traces longer than max_points (default self.max_points) are downsampled, keeping drawdown extremes.
+        """
+        cum_val = self.cumulative[method] + 1
         fig = go.Figure()
         fig.add_trace(go.Scatter(
-            x=cum_val.index, 
-            y=cum_val, 
-            mode='lines', 
+            x=cum_val.index,
+            y=cum_val,
+            mode='lines',
             name="Portfolio Cumulative Return"
         ))
         if benchmark is not None:
             benchmark = benchmark.loc[cum_val.index]
             bench_cum = (1 + benchmark).cumprod()
             fig.add_trace(go.Scatter(
-                x=bench_cum.index, 
-                y=bench_cum, 
-                mode='lines', 
+                x=bench_cum.index,
+                y=bench_cum,
+                mode='lines',
                 name="Benchmark",
                 line=dict(dash='dash')
             ))
         fig.update_layout(
-            title=f"Backtest_{optimization_method}: Cumulative Returns",
+            title=f"Backtest_{method}: Cumulative Returns",
             xaxis_title="Date",
             yaxis_title="Portfolio Value"
         )
+        return downsample_figure(fig, max_points or self.max_points)
 
-        datadic[optimization_method] = {
-            'Total Return': cumulative_returns.iloc[-1],
-            'Annualized Return': ann_return,
-            'Annualized Volatility': ann_vol,
-            'Sharpe Ratio': sharpe,
-            'Maximum Drawdown': max_drawdown
-        }
 
-        return portfolio_returns, cumulative_returns, datadic, fig
+class BacktestingMixin:
+    @instrument('backtest:backtest_portfolio')
+    def backtest_portfolio(self, start_date, end_date, train_window=252, rebalance_period=63,
+                           optimization_method="None", transaction_cost=0.0, benchmark=None):
+        """Backtest the portfolio using a rolling window approach and return a Plotly figure of cumulative returns."""
+        result = self.backtest_many(start_date, end_date, methods=[optimization_method],
+                                    train_window=train_window, rebalance_period=rebalance_period,
+                                    transaction_cost=transaction_cost)
+        self.weight_history = result.weight_history[optimization_method]
+
+        datadic = defaultdict(dict)
+        datadic[optimization_method] = result.stats[optimization_method]
+        fig = result.figure(optimization_method, benchmark)
+        return result.returns[optimization_method], result.cumulative[optimization_method], datadic, fig
+
+    @instrument('backtest:backtest_many')
+    def backtest_many(self, start_date, end_date, methods=None, train_window=252, rebalance_period=63,
+                      transaction_cost=0.0):
+        """Backtest several registered strategies in one walk-forward pass.
+
+        Each training window's optimizer (and its moments) is built once and shared by every requested strategy.
+        Windows are views of the optimizer's returns array, so no per-window copy of the returns is made.
+        """
+        methods = list(STRATEGIES) if methods is None else list(methods)
+        strategies = [get_strategy(m) for m in methods]
+        rows = self.index.slice_indexer(start_date, end_date)
+        bt_values, bt_index = self.values[rows], self.index[rows]
+        n = bt_values.shape[0]
+        returns_lists = {m: [] for m in methods}
+        test_rows = []
+        weight_history = {m: {} for m in methods}
+        prev_weights = dict.fromkeys(methods)
+        rolling = self._rolling_moments(bt_values, train_window)
 
+        i = 0
+        while i + train_window < n:
+            optimizer_train = self._window_optimizer(bt_values, bt_index, i, train_window, rolling)
+
+            rebal_date = bt_index[i + train_window - 1]
+            test_start = i + train_window
+            test_end = min(i + train_window + rebalance_period, n)
+            test_values = bt_values[test_start:test_end]
+            test_rows.append(np.arange(test_start, test_end))
+
+            for strategy in strategies:
+                m = strategy.key
+                weights, _, _ = strategy.run(optimizer_train)
+
+                if prev_weights[m] is not None:
+                    turnover = self.calculate_turnover(prev_weights[m], weights)
+                    cost_adjustment = 1 - (turnover * transaction_cost)
+                else:
+                    cost_adjustment = 1.0
+
+                weight_history[m][rebal_date] = weights
+                returns_lists[m].append(test_values @ weights * cost_adjustment)
+                prev_weights[m] = weights
+            i = test_end
+
+        # Check if any test returns were generated
+        if not strategies or not returns_lists[methods[0]]:
+            raise ValueError("No test data generated during backtest. "
+                             "Check if your dataset has enough rows for the given train_window and rebalance_period.")
+
+        # Test windows are ordered and disjoint, so the dates only need to be attached once at the end.
+        test_index = bt_index[np.concatenate(test_rows)]
+        portfolio_returns = {m: pd.Series(np.concatenate(returns_lists[m]), index=test_index) for m in methods}
+        return BacktestResult(portfolio_returns, weight_history, self.risk_free_rate,
+                              max_points=getattr(self, 'max_plot_points', DEFAULT_MAX_POINTS))
+
+    def _rolling_moments(self, values, train_window):
+        """Incremental window moments, used unless a covariance override, an estimator or missing data is present."""
+        if self._cov_override is not None or self.cov_estimator is not None:
+            return None
+        if train_window < 2 or train_window > values.shape[0] or np.isnan(values).any():
+            return None
+        return RollingMoments(values, train_window)
+
+    def _window_optimizer(self, values, index, start, train_window, rolling):
+        """Build the optimizer for one training window, reusing the rolling moments when available."""
+        stop = start + train_window
+        train_data = pd.DataFrame(values[start:stop], index=index[start:stop], columns=self.columns, copy=False)
+        optimizer_train = self.__class__(train_data, risk_free_rate=self.risk_free_rate,
+                                         cov_estimator=self.cov_estimator, dtype=self.dtype, copy=False)
+        if rolling is not None:
+            mean, cov = rolling.moments(start)
+            optimizer_train.set_moments(mean * 252, cov * 252)
+        elif self._cov_override is not None:
+            optimizer_train.cov_matrix = self.cov_matrix.loc[train_data.columns, train_data.columns]
+        return optimizer_train
+
+    @instrument('sensitivity:sensitivity_analysis')
     def sensitivity_analysis(self, train_windows=[252, 126], rebalance_periods=[63, 21],
                              optimization_method="max_sharpe"):
         """Run backtests over a range of parameters and return performance metrics."""
-        results = []
-        for tw in train_windows:
-            for rp in rebalance_periods:
-                pr, cr, res, _ = self.backtest_portfolio(
-                    start_date=self.returns.index[0],
-                    end_date=self.returns.index[-1],
-                    train_window=tw,
-                    rebalance_period=rp,
-                    optimization_method=optimization_method
-                )
-                ann_return = pr.mean() * 252
-                ann_vol = pr.std() * np.sqrt(252)
-                sharpe = (ann_return - self.risk_free_rate) / ann_vol
-                cum_val = (1 + pr).cumprod()
-                roll_max = cum_val.cummax()
-                drawdown = (cum_val - roll_max) / roll_max
-                max_dd = drawdown.min()
-                results.append({
-                    "Train Window": tw,
-                    "Rebalance Period": rp,
-                    "Annualized Return": ann_return,
-                    "Annualized Volatility": ann_vol,
-                    "Sharpe Ratio": sharpe,
-                    "Max Drawdown": max_dd
-                })
+        results = [self._sensitivity_cell(optimization_method, tw, rp)
+                   for tw in train_windows for rp in rebalance_periods]
         results_df = pd.DataFrame(results)
         result = results_df.to_dict(orient='dict')
         return result
+
+    @instrument('sensitivity:sensitivity_grid')
+    def sensitivity_grid(self, methods=None, train_windows=[252, 126], rebalance_periods=[63, 21],
+                         max_workers=None):
+        """Run the sensitivity grid for several strategies across a process pool.
+
+        Every (method, train_window, rebalance_period) cell is an independent task. Results are returned per
+        method in the same layout as sensitivity_analysis, ordered by train window then rebalance period
+        regardless of completion order. max_workers=1 runs the grid in-process.
+        """
+        methods = list(STRATEGIES) if methods is None else list(methods)
+        for m in methods:
+            get_strategy(m)
+        cells = [(m, tw, rp) for m in methods for tw in train_windows for rp in rebalance_periods]
+        rows = run_cells(self, cells, max_workers)
+        per_method = len(train_windows) * len(rebalance_periods)
+        return {
+            m: pd.DataFrame(rows[k * per_method:(k + 1) * per_method]).to_dict(orient='dict')
+            for k, m in enumerate(methods)
+        }
+
+    def _sensitivity_cell(self, optimization_method, train_window, rebalance_period):
+        """Backtest one strategy over the full sample with the given window parameters and summarize it."""
+        backtest = self.backtest_many(
+            start_date=self.returns.index[0],
+            end_date=self.returns.index[-1],
+            methods=[optimization_method],
+            train_window=train_window,
+            rebalance_period=rebalance_period
+        )
+        stats = backtest.stats[optimization_method]
+        return {
+            "Train Window": train_window,
+            "Rebalance Period": rebalance_period,
+            "Annualized Return": stats['Annualized Return'],
+            "Annualized Volatility": stats['Annualized Volatility'],
+            "Sharpe Ratio": stats['Sharpe Ratio'],
+            "Max Drawdown": stats['Maximum Drawdown']
+        }
@@ -0,0 +1,134 @@
+"""
+Module: covariance.py
+
+Purpose:
+    Covariance estimators for PortfolioOptimizer's cov_estimator argument. Each estimator takes the returns
+    DataFrame and returns the annualized covariance, either as a dense (N x N) array or, for the factor model, as a
+    LowRankCovariance that the optimizer keeps in factor form so that portfolio variance, gradients and Newton steps
+    cost O(N·k) instead of O(N²). Rows with missing values are dropped before estimation. The factories return
+    functools.partial objects so estimators can be pickled into the sensitivity grid's worker processes.
+
+Functions:
+    - ledoit_wolf(returns):
+          Ledoit-Wolf shrinkage of the sample covariance towards a scaled identity, with the optimal intensity.
+    - oas(returns):
+          Oracle Approximating Shrinkage towards the same target, preferable for short histories.
+    - ewma(halflife):
+          Returns an estimator weighting observations exponentially, halving the weight every `halflife` rows.
+    - factor_model(factors):
+          Returns an estimator fitting a k-factor statistical (PCA) model: the top singular vectors of the centered
+          returns as loadings plus a diagonal of specific variances, computed without forming the N x N matrix.
+    - get_estimator(name, halflife, factors):
+          Returns the estimator registered under name ('sample' gives None, i.e. the sample covariance).
+    ESTIMATORS:
+        Names accepted by get_estimator.
+"""
+
+from functools import partial
+import numpy as np
+from scipy.sparse.linalg import svds
+from .moments import LowRankCovariance
+
+ESTIMATORS = ('sample', 'ledoit_wolf', 'oas', 'ewma', 'factor')
+
+
+def _centered(returns):
+    values = returns.to_numpy(dtype=np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    if values.shape[0] < 2:
+        raise ValueError("At least two complete observations are required to estimate a covariance.")
+    return values - values.mean(axis=0)
+
+
+def _shrink(emp_cov, shrinkage):
+    mu = np.trace(emp_cov) / emp_cov.shape[0]
+    cov = (1 - shrinkage) * emp_cov
+    cov[np.diag_indices_from(cov)] += shrinkage * mu
+    return cov
+
+
+def ledoit_wolf(returns):
+    """Annualized Ledoit-Wolf covariance (shrinkage towards mu * I)."""
+    x = _centered(returns)
+    n_obs, n_assets = x.shape
+    emp_cov = x.T @ x / n_obs
+    mu = np.trace(emp_cov) / n_assets
+    # sum_ij sum_t x_ti^2 x_tj^2 collapses to sum_t (sum_i x_ti^2)^2, so no second N x N product is needed.
+    beta = (np.sum(np.sum(x ** 2, axis=1) ** 2) / n_obs - np.sum(emp_cov ** 2)) / (n_assets * n_obs)
+    delta = (np.sum(emp_cov ** 2) - 2 * mu * np.trace(emp_cov) + n_assets * mu ** 2) / n_assets
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 else beta / delta
+    return _shrink(emp_cov, shrinkage) * 252
+
+
+def oas(returns):
+    """Annualized Oracle Approximating Shrinkage covariance (shrinkage towards mu * I)."""
+    x = _centered(returns)
+    n_obs, n_assets = x.shape
+    emp_cov = x.T @ x / n_obs
+    mu = np.trace(emp_cov) / n_assets
+    alpha = np.mean(emp_cov ** 2)
+    num = alpha + mu ** 2
+    den = (n_obs + 1) * (alpha - mu ** 2 / n_assets)
+    shrinkage = 1.0 if den == 0 else min(num / den, 1.0)
+    return _shrink(emp_cov, shrinkage) * 252
+
+
+def _ewma(returns, halflife):
+    values = returns.to_numpy(dtype=np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    n_obs = values.shape[0]
+    if n_obs < 2:
+        raise ValueError("At least two complete observations are required to estimate a covariance.")
+    weights = 0.5 ** (np.arange(n_obs - 1, -1, -1) / halflife)
+    weights /= weights.sum()
+    x = values - weights @ values
+    # Reliability-weight correction, which reduces to the usual n - 1 denominator for equal weights.
+    cov = (x * weights[:, None]).T @ x / (1 - np.sum(weights ** 2))
+    return cov * 252
+
+
+def ewma(halflife=63):
+    """Estimator giving observation t a weight proportional to 0.5 ** (age / halflife)."""
+    if halflife <= 0:
+        raise ValueError("halflife must be positive.")
+    return partial(_ewma, halflife=halflife)
+
+
+def _factor_model(returns, factors):
+    x = _centered(returns)
+    x /= np.sqrt(x.shape[0] - 1)
+    k = min(factors, min(x.shape) - 1)
+    if k < 1:
+        raise ValueError("The factor model needs more observations and assets than factors.")
+    if k < min(x.shape) - 1:
+        # A fixed start vector keeps the truncated SVD deterministic.
+        u, s, vt = svds(x, k=k, v0=np.ones(min(x.shape)))
+    else:
+        u, s, vt = np.linalg.svd(x, full_matrices=False)
+        s, vt = s[:k], vt[:k]
+    loadings = vt.T * s
+    total = np.sum(x ** 2, axis=0)
+    specific = np.clip(total - np.sum(loadings ** 2, axis=1), 1e-12 * max(total.max(), 1e-300), None)
+    return LowRankCovariance(loadings * np.sqrt(252), specific * 252)
+
+
+def factor_model(factors=5):
+    """Estimator fitting a `factors`-factor PCA model, returned in low-rank plus diagonal form."""
+    if factors < 1:
+        raise ValueError("factors must be at least 1.")
+    return partial(_factor_model, factors=factors)
+
+
+def get_estimator(name, halflife=63, factors=5):
+    if name == 'sample':
+        return None
+    if name == 'ledoit_wolf':
+        return ledoit_wolf
+    if name == 'oas':
+        return oas
+    if name == 'ewma':
+        return ewma(halflife)
+    if name == 'factor':
+        return factor_model(factors)
+    raise ValueError(f"Unknown covariance estimator {name!r}; expected one of {', '.join(ESTIMATORS)}.")
@@ -0,0 +1,115 @@
+"""
+Module: downsample.py
+
+Purpose:
+    Reduces long line series to a bounded number of points before they are handed to Plotly, so figure size and
+    render time stay flat as the history grows. Points that define the maximum drawdown (its peak and trough) and
+    the series' extremes are always kept, so the visual story of a backtest survives the reduction.
+
+Functions:
+    - lttb(x, y, n_out):
+          Indices of the Largest-Triangle-Three-Buckets selection of n_out points.
+    - minmax(y, n_out):
+          Indices of the minimum and maximum of each of n_out / 2 equal buckets.
+    - downsample_indices(x, y, max_points, method, offset):
+          Indices selected by `method` ('lttb' or 'minmax') plus the first and last points, the global extremes and
+          the peak and trough of the maximum drawdown of the level series y + offset.
+    - downsample_figure(fig, max_points, method, offset):
+          Downsamples, in place, every line trace of a figure that has more than max_points points.
+"""
+
+import numpy as np
+
+DEFAULT_MAX_POINTS = 2000
+
+
+def _numeric(x):
+    x = np.asarray(x)
+    if x.dtype.kind == 'M':
+        return x.astype('datetime64[ns]').astype(np.int64).astype(np.float64)
+    return x.astype(np.float64)
+
+
+def lttb(x, y, n_out):
+    x, y = _numeric(x), np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    # Interior points are split into n_out - 2 buckets; the first and last points are always selected.
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        # The third vertex is the average of the next bucket (the last point for the final bucket).
+        cx = x[nxt_lo:nxt_hi].mean() if nxt_hi > nxt_lo else x[-1]
+        cy = y[nxt_lo:nxt_hi].mean() if nxt_hi > nxt_lo else y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax(y, n_out):
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    buckets = max(n_out // 2, 1)
+    if n_out >= n:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    blocks = padded.reshape(buckets, size)
+    valid = ~np.isnan(blocks).all(axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = np.nanargmin(blocks[valid], axis=1) + offsets
+    highs = np.nanargmax(blocks[valid], axis=1) + offsets
+    return np.unique(np.concatenate([lows, highs]))
+
+
+def _drawdown_extremes(level):
+    if not np.isfinite(level).any():
+        return []
+    peaks = np.fmax.accumulate(level)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown = level / peaks - 1
+    if not np.isfinite(drawdown).any():
+        return []
+    trough = int(np.nanargmin(drawdown))
+    peak = int(np.nanargmax(level[:trough + 1]))
+    return [peak, trough]
+
+
+def downsample_indices(x, y, max_points=DEFAULT_MAX_POINTS, method='lttb', offset=0.0):
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if max_points is None or n <= max_points:
+        return np.arange(n)
+    if method == 'lttb':
+        picked = lttb(x, y, max_points)
+    elif method == 'minmax':
+        picked = minmax(y, max_points)
+    else:
+        raise ValueError("method must be 'lttb' or 'minmax'.")
+    keep = [0, n - 1] + _drawdown_extremes(y + offset)
+    if np.isfinite(y).any():
+        keep += [int(np.nanargmin(y)), int(np.nanargmax(y))]
+    return np.union1d(picked, keep)
+
+
+def downsample_figure(fig, max_points=DEFAULT_MAX_POINTS, method='lttb', offset=0.0):
+    """Downsample every long line trace of fig in place; offset turns y into the level series used for drawdowns."""
+    if max_points is None:
+        return fig
+    for trace in fig.data:
+        if trace.type not in ('scatter', 'scattergl') or trace.y is None or 'lines' not in (trace.mode or 'lines'):
+            continue
+        y = np.asarray(trace.y)
+        if len(y) <= max_points:
+            continue
+        x = np.arange(len(y)) if trace.x is None else np.asarray(trace.x)
+        idx = downsample_indices(x, y, max_points, method, offset)
+        trace.update(x=x[idx], y=y[idx])
+    return fig
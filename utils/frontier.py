@@ -0,0 +1,160 @@
+"""
+Module: frontier.py
+
+Purpose:
+    Traces the exact long-only mean-variance efficient frontier with the Critical Line Algorithm (CLA) of Markowitz,
+    following the open-source formulation of Bailey and López de Prado. The CLA returns the frontier's turning points;
+    between two consecutive turning points the efficient weights are an affine function of the target return, so the
+    frontier can be sampled at any resolution by interpolation without solving further optimization problems.
+
+Classes and Functions:
+    critical_line(mean, cov, lower, upper):
+        Runs the CLA and returns the turning-point weights (ordered from the maximum-return portfolio down to the
+        minimum-variance portfolio) together with their lambdas.
+    FrontierMixin:
+        Methods:
+            - efficient_frontier(points):
+                  Returns arrays of annualized returns, volatilities and weights for `points` portfolios evenly spaced
+                  in return between the minimum-variance and maximum-return portfolios.
+"""
+
+import numpy as np
+
+
+def _free_system(cov, mean, free, bound, w):
+    """Inverse covariance of the free assets and the terms that couple them to the bounded weights."""
+    cov_f_inv = np.linalg.inv(cov[np.ix_(free, free)])
+    cov_fb = cov[np.ix_(free, bound)]
+    w_b = w[bound]
+    ones_f = np.ones(len(free))
+    a1 = cov_f_inv @ ones_f
+    a_mu = cov_f_inv @ mean[free]
+    l3 = cov_f_inv @ (cov_fb @ w_b)
+    return cov_f_inv, cov_fb, a1, a_mu, l3, w_b.sum()
+
+
+def _free_weights(lam, a1, a_mu, l3, w_b_sum):
+    c1 = a1.sum()
+    gamma = (-lam * a_mu.sum() + (1 - w_b_sum + l3.sum())) / c1
+    return -l3 + gamma * a1 + lam * a_mu
+
+
+def critical_line(mean, cov, lower=None, upper=None, max_iter=None):
+    """Turning points of the long-only efficient frontier as (weights[K, N], lambdas[K])."""
+    mean = np.asarray(mean, dtype=np.float64)
+    cov = np.asarray(cov, dtype=np.float64)
+    n = mean.shape[0]
+    lower = np.zeros(n) if lower is None else np.asarray(lower, dtype=np.float64)
+    upper = np.ones(n) if upper is None else np.asarray(upper, dtype=np.float64)
+    if lower.sum() > 1 or upper.sum() < 1:
+        raise ValueError("Weight bounds do not admit a fully invested portfolio.")
+    max_iter = 10 * n + 10 if max_iter is None else max_iter
+
+    # Start from the highest-return corner: fill assets at their upper bound in order of decreasing mean.
+    order = np.argsort(-mean, kind='stable')
+    w = lower.copy()
+    k = 0
+    while w.sum() < 1:
+        w[order[k]] = upper[order[k]]
+        k += 1
+    first = order[k - 1]
+    w[first] += 1 - w.sum()
+    free = [first]
+    weights, lambdas = [w.copy()], [np.inf]
+
+    for _ in range(max_iter):
+        lam_prev = lambdas[-1]
+        tol = 1e-12 * (1 + abs(lam_prev)) if np.isfinite(lam_prev) else 0.0
+        bound = np.setdiff1d(np.arange(n), free)
+        cov_f_inv, cov_fb, a1, a_mu, l3, w_b_sum = _free_system(cov, mean, free, bound, w)
+        c1, c3 = a1.sum(), a_mu.sum()
+
+        # Case a: a free weight moves to one of its bounds.
+        l_in, i_in, b_in = None, None, None
+        if len(free) > 1:
+            c = -c1 * a_mu + c3 * a1
+            targets = np.where(c > 0, upper[free], lower[free])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lam = ((1 - w_b_sum + l3.sum()) * a1 - c1 * (targets + l3)) / c
+            lam[(c == 0) | ~(lam < lam_prev - tol)] = -np.inf
+            j = int(np.argmax(lam))
+            if np.isfinite(lam[j]):
+                l_in, i_in, b_in = lam[j], free[j], targets[j]
+
+        # Case b: a bounded weight becomes free. All candidates are evaluated at once through the bordered inverse.
+        l_out, i_out = None, None
+        if bound.size:
+            s = cov_fb
+            u = cov_f_inv @ s
+            d = cov[bound, bound] - np.einsum('ij,ij->j', s, u)
+            one_u = u.sum(axis=0)
+            w_i = w[bound]
+            v = cov_fb @ w[bound]
+            y_last = cov[np.ix_(bound, bound)] @ w[bound] - cov[bound, bound] * w_i
+            u_y = u.T @ v - np.einsum('ij,ij->j', u, s) * w_i
+            one_a_y = a1 @ v - one_u * w_i
+            c1b = c1 + (one_u - 1) ** 2 / d
+            c3b = c3 + (one_u - 1) * (u.T @ mean[free] - mean[bound]) / d
+            c2_last = (mean[bound] - u.T @ mean[free]) / d
+            c4_last = (1 - one_u) / d
+            l3_last = (y_last - u_y) / d
+            l2b = one_a_y + (one_u - 1) * (u_y - y_last) / d
+            l1b = w_b_sum - w_i
+            cb = -c1b * c2_last + c3b * c4_last
+            with np.errstate(divide='ignore', invalid='ignore'):
+                lam = ((1 - l1b + l2b) * c4_last - c1b * (w_i + l3_last)) / cb
+            lam[(cb == 0) | (d <= 0) | ~(lam < lam_prev - tol)] = -np.inf
+            j = int(np.argmax(lam))
+            if np.isfinite(lam[j]):
+                l_out, i_out = lam[j], bound[j]
+
+        if (l_in is None or l_in < 0) and (l_out is None or l_out < 0):
+            # No further turning point with a positive lambda: finish with the minimum-variance portfolio.
+            lam = 0.0
+        elif l_out is None or (l_in is not None and l_in > l_out):
+            lam = l_in
+            free.remove(i_in)
+            w[i_in] = b_in
+        else:
+            lam = l_out
+            free.append(i_out)
+        bound = np.setdiff1d(np.arange(n), free)
+        _, _, a1, a_mu, l3, w_b_sum = _free_system(cov, mean, free, bound, w)
+        w[free] = _free_weights(lam, a1, a_mu, l3, w_b_sum)
+        weights.append(w.copy())
+        lambdas.append(lam)
+        if lam == 0.0:
+            break
+
+    weights, lambdas = np.array(weights), np.array(lambdas)
+    # Drop numerically invalid turning points, then any point dominated in return by a later one.
+    valid = ((np.abs(weights.sum(axis=1) - 1) < 1e-9)
+             & np.all(weights >= lower - 1e-9, axis=1) & np.all(weights <= upper + 1e-9, axis=1))
+    weights, lambdas = weights[valid], lambdas[valid]
+    rets = weights @ mean
+    later_max = np.append(np.maximum.accumulate(rets[::-1])[::-1][1:], -np.inf)
+    keep = rets >= later_max
+    keep[0] = True
+    return np.clip(weights[keep], lower, upper), lambdas[keep]
+
+
+class FrontierMixin:
+    def efficient_frontier(self, points=50):
+        """Exact efficient frontier sampled at `points` evenly spaced returns, as (returns, volatilities, weights)."""
+        moments = self.moments
+        turning, _ = critical_line(moments.mean, moments.cov)
+        turning = turning[::-1]
+        turning_rets = turning @ moments.mean
+        targets = np.linspace(turning_rets[0], turning_rets[-1], points)
+        if len(turning) == 1:
+            weights = np.repeat(turning, points, axis=0)
+        else:
+            seg = np.clip(np.searchsorted(turning_rets, targets, side='right') - 1, 0, len(turning) - 2)
+            span = turning_rets[seg + 1] - turning_rets[seg]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                alpha = np.where(span > 0, (targets - turning_rets[seg]) / span, 0.0)
+            alpha = np.clip(alpha, 0.0, 1.0)[:, None]
+            weights = (1 - alpha) * turning[seg] + alpha * turning[seg + 1]
+        rets = weights @ moments.mean
+        vols = np.sqrt(np.clip(moments.batch_variance(weights), 0.0, None))
+        return rets, vols, weights
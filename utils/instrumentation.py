@@ -0,0 +1,164 @@
+"""
+Module: instrumentation.py
+
+Purpose:
+    Lightweight, thread-safe timing and counting for the expensive stages of a run (data download, each optimizer,
+    backtests, sensitivity grids and figure rendering), so a slow CLI run or web request can be broken down by stage.
+    Every timed stage keeps its call count, total/max time, a latency histogram and any extra counters such as the
+    solver's iteration and function-evaluation counts. While tracemalloc is tracing, the peak memory allocated
+    above the level at entry is recorded per stage too (process-wide, so concurrent stages inflate each other).
+
+Classes and Functions:
+    Profiler:
+        Methods:
+            - record(name, seconds, peak_bytes, **counters):
+                  Adds one timed call of a stage and accumulates its counters; the stage keeps the largest
+                  peak_bytes seen.
+            - count(name, value, **counters):
+                  Accumulates counters without a timing.
+            - timer(name):
+                  Context manager that records the wall time of its block.
+            - snapshot():
+                  Returns a JSON-serializable copy of every stage's statistics and histogram.
+            - report():
+                  Formats a per-stage breakdown sorted by total time.
+            - reset():
+                  Clears all statistics.
+    PROFILER:
+        The process-wide Profiler used by the instrumented functions.
+    peak_memory():
+        Context manager yielding a dict whose 'bytes' entry is set, on exit, to the block's peak traced allocation
+        above its starting level (None unless tracemalloc is tracing). Nested blocks do not hide each other's peaks.
+    instrument(name, solver):
+        Decorator timing each call of a function under `name` (default: its qualified name). With solver=True, the
+        nit/nfev entries of the instance's solver_info are added as counters.
+"""
+
+import bisect
+import functools
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+
+class Profiler:
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def _stage(self, name):
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {'calls': 0, 'total': 0.0, 'max': 0.0, 'peak_bytes': None,
+                                          'histogram': [0] * (len(self.buckets) + 1), 'counters': {}}
+        return stage
+
+    def _add_counters(self, stage, counters):
+        for key, value in counters.items():
+            if value is not None:
+                stage['counters'][key] = stage['counters'].get(key, 0) + value
+
+    def record(self, name, seconds, peak_bytes=None, **counters):
+        with self._lock:
+            stage = self._stage(name)
+            stage['calls'] += 1
+            stage['total'] += seconds
+            stage['max'] = max(stage['max'], seconds)
+            if peak_bytes is not None:
+                stage['peak_bytes'] = max(stage['peak_bytes'] or 0, peak_bytes)
+            stage['histogram'][bisect.bisect_left(self.buckets, seconds)] += 1
+            self._add_counters(stage, counters)
+
+    def count(self, name, value=1, **counters):
+        with self._lock:
+            stage = self._stage(name)
+            self._add_counters(stage, dict(counters, count=value))
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        with peak_memory() as memory:
+            try:
+                yield
+            finally:
+                seconds = time.perf_counter() - start
+        self.record(name, seconds, memory['bytes'])
+
+    def snapshot(self):
+        with self._lock:
+            stages = {name: {'calls': s['calls'], 'total': s['total'], 'max': s['max'], 'peak_bytes': s['peak_bytes'],
+                             'mean': s['total'] / s['calls'] if s['calls'] else 0.0,
+                             'histogram': dict(zip([str(b) for b in self.buckets] + ['+Inf'], s['histogram'])),
+                             'counters': dict(s['counters'])}
+                      for name, s in self._stages.items()}
+        return {'buckets': list(self.buckets), 'stages': stages}
+
+    def report(self):
+        stages = self.snapshot()['stages']
+        lines = [f"{'Stage':<40} {'Calls':>6} {'Total s':>9} {'Mean s':>9} {'Max s':>9} {'Peak MB':>9}  Counters"]
+        for name, s in sorted(stages.items(), key=lambda item: -item[1]['total']):
+            counters = ' '.join(f"{k}={v:g}" for k, v in sorted(s['counters'].items()))
+            peak = '-' if s['peak_bytes'] is None else f"{s['peak_bytes'] / 2 ** 20:.1f}"
+            lines.append(f"{name:<40} {s['calls']:>6} {s['total']:>9.3f} {s['mean']:>9.4f} {s['max']:>9.4f} "
+                         f"{peak:>9}  {counters}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+PROFILER = Profiler()
+
+# Per-thread stack of [level at entry, highest level seen] for the peak_memory blocks currently open.
+_MEMORY = threading.local()
+
+
+@contextmanager
+def peak_memory():
+    memory = {'bytes': None}
+    if not tracemalloc.is_tracing():
+        yield memory
+        return
+    stack = _MEMORY.__dict__.setdefault('stack', [])
+    current, peak = tracemalloc.get_traced_memory()
+    # reset_peak() is global, so the enclosing block keeps the peak it has seen so far before it is reset.
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    stack.append([current, current])
+    try:
+        yield memory
+    finally:
+        base, seen = stack.pop()
+        top = max(seen, tracemalloc.get_traced_memory()[1])
+        if stack:
+            stack[-1][1] = max(stack[-1][1], top)
+        memory['bytes'] = top - base
+
+
+def instrument(name=None, solver=False):
+    def decorator(func):
+        stage = name or func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            memory = {'bytes': None}
+            try:
+                with peak_memory() as memory:
+                    return func(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                counters = {}
+                if solver and args:
+                    info = getattr(args[0], 'solver_info', None) or {}
+                    counters = {key: info.get(key) for key in ('nit', 'nfev') if key in info}
+                PROFILER.record(stage, seconds, memory['bytes'], **counters)
+        return wrapper
+    return decorator
@@ -0,0 +1,119 @@
+"""
+Module: jobs.py
+
+Purpose:
+    Runs long analyses outside the request that submitted them. Jobs are executed by a local thread or process pool,
+    so no external broker is needed, and report their progress through a shared status store that request handlers
+    can poll.
+
+Classes:
+    JobManager:
+        Constructor:
+            - __init__(backend, max_workers, max_jobs):
+                  Creates the executor ('thread' or 'process') and the status store. At most `max_jobs` finished
+                  jobs are retained; older ones are forgotten first.
+        Methods:
+            - submit(func, *args, **kwargs):
+                  Queues func(*args, progress=..., **kwargs) and returns its job id immediately. The job reports
+                  progress by calling progress(fraction, message).
+            - status(job_id):
+                  Returns a JSON-serializable dict with the job's state ('queued', 'running', 'done' or 'failed'),
+                  progress fraction, last message and error, or None for an unknown id.
+            - result(job_id):
+                  Returns the job's result once it is done; raises KeyError for unknown ids and re-raises the
+                  job's exception if it failed.
+            - shutdown(wait):
+                  Stops the executor.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import Manager
+
+
+class _Progress:
+    """Picklable progress callback that writes into the shared status store."""
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+
+    def __call__(self, fraction, message=''):
+        self.store[self.job_id] = {'state': 'running', 'progress': min(max(float(fraction), 0.0), 1.0),
+                                   'message': message}
+
+
+def _run_job(store, job_id, func, args, kwargs):
+    store[job_id] = {'state': 'running', 'progress': 0.0, 'message': 'Started'}
+    return func(*args, progress=_Progress(store, job_id), **kwargs)
+
+
+class JobManager:
+    def __init__(self, backend='thread', max_workers=2, max_jobs=100):
+        if backend == 'thread':
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+            self._store = {}
+        elif backend == 'process':
+            self._manager = Manager()
+            self._executor = ProcessPoolExecutor(max_workers=max_workers)
+            self._store = self._manager.dict()
+        else:
+            raise ValueError("backend must be 'thread' or 'process'.")
+        self.backend = backend
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        self._store[job_id] = {'state': 'queued', 'progress': 0.0, 'message': 'Queued'}
+        with self._lock:
+            self._jobs[job_id] = {'future': None, 'submitted': time.time(), 'finished': None}
+            self._prune()
+        future = self._executor.submit(_run_job, self._store, job_id, func, args, kwargs)
+        with self._lock:
+            self._jobs[job_id]['future'] = future
+        future.add_done_callback(lambda _: self._finish(job_id))
+        return job_id
+
+    def _finish(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]['finished'] = time.time()
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['finished'] is not None]
+        for job_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+            del self._jobs[job_id]
+            self._store.pop(job_id, None)
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        status = {'id': job_id, 'submitted': job['submitted'], 'finished': job['finished'], 'error': None}
+        status.update(self._store.get(job_id, {}))
+        future = job['future']
+        if future is not None and future.done():
+            error = future.exception()
+            if error is None:
+                status.update(state='done', progress=1.0, message='Done')
+            else:
+                status.update(state='failed', error=str(error) or type(error).__name__)
+        return status
+
+    def result(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or job['future'] is None:
+            raise KeyError(job_id)
+        return job['future'].result(timeout=0)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        if self.backend == 'process':
+            self._manager.shutdown()
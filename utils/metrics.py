@@ -5,9 +5,13 @@ Purpose:
     Provides functions to calculate key performance metrics for a portfolio, including annualized return,
     volatility, Sharpe ratio, Sortino ratio, maximum drawdown, Value at Risk (VaR), and Conditional VaR (CVaR).
 
+    Every metric works on the optimizer's returns ndarray (`values`); pandas objects are never built here.
+
 Classes:
     MetricsMixin:
         Methods:
+            - _portfolio_returns(weights):
+                  Daily portfolio returns as a float64 ndarray, values @ weights.
             - _portfolio_performance(weights):
                   Computes unrounded annualized return and volatility based on the portfolio's returns.
             - calculate_portfolio_performance(weights):
@@ -34,11 +38,17 @@ def _to_float(x):
     return float(round(x, 2))
 
 class MetricsMixin:
+    def _portfolio_returns(self, weights):
+        """Daily portfolio returns as an ndarray, computed in the storage type of the returns array."""
+        values = self.values
+        return np.asarray(values @ np.asarray(weights, dtype=values.dtype), dtype=np.float64)
+
     def _portfolio_performance(self, weights):
         """Calculate unrounded annualized return and volatility."""
-        annual_return = np.sum(self.returns.mean() * weights) * 252
-        cov_matrix = self.returns.cov() * 252
-        annual_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
+        weights = np.asarray(weights, dtype=np.float64)
+        moments = self.moments
+        annual_return = moments.mean @ weights
+        annual_vol = np.sqrt(moments.variance(weights))
         return annual_return, annual_vol
 
     def calculate_portfolio_performance(self, weights):
@@ -54,7 +64,7 @@ class MetricsMixin:
         return (ret - self.risk_free_rate) / vol
 
     def calculate_cvar(self, weights, alpha=0.05):
-        port_returns = self.returns @ weights
+        port_returns = self._portfolio_returns(weights)
         var = self.calculate_var(weights, alpha)
         cvar_values = port_returns[port_returns <= var]
         if len(cvar_values) == 0:
@@ -64,24 +74,17 @@ class MetricsMixin:
     def calculate_sharpe_ratio(self, weights):
         return _to_float(self._sharpe_ratio(weights))
 
-    def _calculate_cluster_risk(self, indices):
-        cov = self.returns.cov() * 252
-        cluster_weights = np.ones(len(indices))
-        cluster_weights /= np.sum(cluster_weights)
-        cluster_cov = cov.iloc[indices, indices]
-        risk = np.sqrt(np.dot(cluster_weights.T, np.dot(cluster_cov, cluster_weights)))
-        return risk
-    
     def _calculate_risk_contributions(self, weights):
-        cov_matrix = self.returns.cov() * 252
-        port_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-        marginal = np.dot(cov_matrix, weights) / port_vol
+        weights = np.asarray(weights, dtype=np.float64)
+        sigma_w = self.moments.cov_dot(weights)
+        port_vol = np.sqrt(np.dot(weights, sigma_w))
+        marginal = sigma_w / port_vol
         return weights * marginal
     
     def _sortino_ratio(self, weights, target_return=0.0):
         """Calculate unrounded Sortino ratio using unrounded performance metrics."""
         ret, _ = self._portfolio_performance(weights)
-        port_returns = self.returns @ weights
+        port_returns = self._portfolio_returns(weights)
         downside = np.minimum(port_returns - target_return, 0)
         downside_vol = np.sqrt(np.mean(downside ** 2)) * np.sqrt(252)
         if downside_vol == 0:
@@ -92,14 +95,14 @@ class MetricsMixin:
         return _to_float(self._sortino_ratio(weights, target_return))
 
     def calculate_max_drawdown(self, weights):
-        port_returns = self.returns @ weights
+        port_returns = self._portfolio_returns(weights)
         cumulative = np.cumprod(1 + port_returns) - 1
         peak = np.maximum.accumulate(cumulative)
         drawdowns = np.where(peak == 0, 0, (peak - cumulative) / peak)
         return _to_float(np.nanmax(drawdowns))
 
     def calculate_var(self, weights, alpha=0.05):
-        port_returns = self.returns @ weights
+        port_returns = self._portfolio_returns(weights)
         return _to_float(np.percentile(port_returns, alpha * 100))
 
     
\ No newline at end of file
@@ -0,0 +1,179 @@
+"""
+Module: moments.py
+
+Purpose:
+    Holds the annualized first and second moments of an asset returns matrix so that metrics and optimization
+    objectives can share one set of arrays instead of rebuilding the covariance matrix on every call.
+
+Classes and Functions:
+    Moments:
+        Constructor:
+            - __init__(mean, cov):
+                  Stores the annualized mean vector and covariance matrix as contiguous float64 arrays and
+                  derives the annualized volatility vector from the covariance diagonal.
+        Attributes:
+            - corr:
+                  Correlation matrix derived from the covariance, computed on first access.
+            - distance:
+                  Correlation distance sqrt((1 - corr) / 2) used for hierarchical clustering, computed on first access.
+        Methods:
+            - variance(weights):
+                  Returns the annualized portfolio variance w' Σ w.
+            - cov_dot(weights):
+                  Returns the covariance-weights product Σ w used by volatility gradients and risk contributions.
+            - batch_variance(weights):
+                  Returns the variance of every row of a (P x N) weight matrix in one einsum.
+            - solve_shifted(shift, rhs):
+                  Solves (Σ + diag(shift)) x = rhs for a positive shift, as needed by Newton steps on barrier problems.
+            - linkage(method):
+                  Returns the hierarchical clustering linkage of the distance matrix, cached per linkage method.
+    LowRankCovariance(factors, specific):
+        Covariance held as factors @ factors.T + diag(specific), as returned by factor-model estimators.
+    LowRankMoments (inherits from Moments):
+        Constructor:
+            - __init__(mean, factors, specific):
+                  Stores an (N x k) factor loading matrix and the N specific variances instead of a dense covariance.
+        Attributes:
+            - cov:
+                  The dense covariance, formed only on first access (by HRP, the critical line algorithm or
+                  the cov_matrix property).
+        Methods:
+            - variance, cov_dot, batch_variance:
+                  Evaluated through the factors in O(N·k) per portfolio.
+            - solve_shifted(shift, rhs):
+                  Solved with the Woodbury identity in O(N·k²).
+    compute_moments(returns, cov_estimator, cov_matrix, values):
+        Builds a Moments instance from a returns DataFrame, honoring an explicit covariance override or a
+        covariance estimator callable before falling back to the sample covariance. An estimator returning a
+        LowRankCovariance yields LowRankMoments. When the returns are also
+        given as a complete ndarray (values), the mean and sample covariance are computed on it directly, in
+        float64 whatever its storage type; missing data falls back to pandas' pairwise statistics.
+    sample_moments(values, chunk_rows):
+        Daily mean and sample covariance of a (T x N) array, accumulated in float64 over blocks of chunk_rows rows
+        so that float32 storage is never converted to float64 as a whole.
+"""
+
+from collections import namedtuple
+import numpy as np
+import scipy.linalg as sla
+from scipy.cluster.hierarchy import linkage
+from scipy.spatial.distance import squareform
+
+
+class Moments:
+    def __init__(self, mean, cov):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float64)
+        self.cov = np.ascontiguousarray(cov, dtype=np.float64)
+        self.std = np.sqrt(np.clip(np.diag(self.cov), 0.0, None))
+        self._corr = None
+        self._distance = None
+        self._linkages = {}
+
+    @property
+    def corr(self):
+        if self._corr is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                corr = self.cov / np.outer(self.std, self.std)
+            corr[~np.isfinite(corr)] = 0.0
+            np.fill_diagonal(corr, 1.0)
+            self._corr = np.ascontiguousarray(corr)
+        return self._corr
+
+    @property
+    def distance(self):
+        if self._distance is None:
+            self._distance = np.sqrt(np.clip(0.5 * (1 - self.corr), 0.0, None))
+        return self._distance
+
+    def linkage(self, method='single'):
+        if method not in self._linkages:
+            self._linkages[method] = linkage(squareform(self.distance, checks=False), method=method)
+        return self._linkages[method]
+
+    def variance(self, weights):
+        return float(weights @ self.cov @ weights)
+
+    def cov_dot(self, weights):
+        return self.cov @ weights
+
+    def batch_variance(self, weights):
+        return np.einsum('ij,ij->i', weights @ self.cov, weights)
+
+    def solve_shifted(self, shift, rhs):
+        matrix = self.cov + np.diag(shift)
+        return sla.cho_solve(sla.cho_factor(matrix), rhs)
+
+
+LowRankCovariance = namedtuple('LowRankCovariance', ['factors', 'specific'])
+
+
+class LowRankMoments(Moments):
+    def __init__(self, mean, factors, specific):
+        self.mean = np.ascontiguousarray(mean, dtype=np.float64)
+        self.factors = np.ascontiguousarray(factors, dtype=np.float64)
+        self.specific = np.ascontiguousarray(specific, dtype=np.float64)
+        self.std = np.sqrt(np.clip(np.einsum('ik,ik->i', self.factors, self.factors) + self.specific, 0.0, None))
+        self._cov = None
+        self._corr = None
+        self._distance = None
+        self._linkages = {}
+
+    @property
+    def cov(self):
+        if self._cov is None:
+            cov = self.factors @ self.factors.T
+            cov[np.diag_indices_from(cov)] += self.specific
+            self._cov = cov
+        return self._cov
+
+    def variance(self, weights):
+        exposure = self.factors.T @ weights
+        return float(exposure @ exposure + np.dot(self.specific * weights, weights))
+
+    def cov_dot(self, weights):
+        return self.factors @ (self.factors.T @ weights) + self.specific * weights
+
+    def batch_variance(self, weights):
+        exposure = weights @ self.factors
+        return np.einsum('ij,ij->i', exposure, exposure) + (weights ** 2) @ self.specific
+
+    def solve_shifted(self, shift, rhs):
+        # (D + B B')^-1 r = D^-1 r - D^-1 B (I + B' D^-1 B)^-1 B' D^-1 r, with D = diag(specific + shift).
+        inv_d = 1.0 / (self.specific + shift)
+        scaled = self.factors * inv_d[:, None]
+        capacitance = np.eye(self.factors.shape[1]) + self.factors.T @ scaled
+        y = inv_d * rhs
+        return y - scaled @ sla.cho_solve(sla.cho_factor(capacitance), self.factors.T @ y)
+
+
+def sample_moments(values, chunk_rows=4096):
+    """Daily mean and sample covariance of values, accumulated in float64 one block of rows at a time."""
+    n_obs, n_assets = values.shape
+    mean = values.mean(axis=0, dtype=np.float64)
+    cross = np.zeros((n_assets, n_assets))
+    for start in range(0, n_obs, chunk_rows):
+        block = values[start:start + chunk_rows].astype(np.float64) - mean
+        cross += block.T @ block
+    cov = cross / (n_obs - 1)
+    return mean, 0.5 * (cov + cov.T)
+
+
+def compute_moments(returns, cov_estimator=None, cov_matrix=None, values=None):
+    """Compute annualized moments, preferring an explicit covariance, then the estimator, then the sample."""
+    if values is not None and np.isnan(values).any():
+        values = None
+    if values is not None:
+        mean = values.mean(axis=0, dtype=np.float64) * 252
+    else:
+        mean = returns.mean().to_numpy(dtype=np.float64) * 252
+    if cov_matrix is not None:
+        cov = cov_matrix
+    elif cov_estimator is not None:
+        cov = cov_estimator(returns)
+    elif values is not None:
+        cov = sample_moments(values)[1] * 252
+    else:
+        cov = returns.cov().to_numpy(dtype=np.float64) * 252
+    if isinstance(cov, LowRankCovariance):
+        return LowRankMoments(mean, cov.factors, cov.specific)
+    return Moments(mean, np.asarray(cov, dtype=np.float64))
@@ -8,29 +8,43 @@ Purpose:
 
 Classes:
     OptimizationMixin:
+        Attributes:
+            - solver_info:
+                  Diagnostics of the most recent optimization (iterations, evaluations, convergence and residuals).
         Methods:
             - _get_default_optimization_setup():
-                  Sets up constraints, bounds, and initial guess for the optimization problem.
-            - _optimize(objective):
-                  General-purpose optimization routine that minimizes the given objective function under the default setup.
+                  Sets up constraints (with the constant budget-constraint Jacobian), bounds, and initial guess.
+            - _optimize(objective, jac):
+                  General-purpose optimization routine that minimizes the given objective function under the default setup,
+                  passing the analytic gradient to SLSQP when one is supplied. When gradient_check is enabled, the
+                  gradient is first compared against central finite differences.
+            - check_gradients(weights):
+                  Returns the relative error between each analytic gradient and its finite-difference estimate.
             - minimize_volatility():
                   Optimizes the portfolio weights to minimize the portfolio volatility.
             - maximize_sharpe_ratio():
                   Optimizes the portfolio weights to maximize the Sharpe ratio (by minimizing the negative Sharpe).
             - minimize_cvar(alpha):
-                  Optimizes the portfolio to minimize Conditional Value at Risk (CVaR).
+                  Optimizes the portfolio to minimize Conditional Value at Risk (CVaR) by solving the
+                  Rockafellar-Uryasev linear program with HiGHS over the historical return scenarios.
             - equal_weight():
                   Constructs a portfolio with equal weights for all assets.
-            - hierarchical_risk_parity():
-                  Implements the HRP method by clustering assets based on correlations and allocating risk evenly among clusters.
+            - hierarchical_risk_parity(linkage_method):
+                  Implements the HRP method: clusters assets on the cached correlation distance with the given linkage
+                  method, then recursively bisects the quasi-diagonal order, splitting weight between the halves in
+                  inverse proportion to their inverse-variance cluster variances.
             - maximum_diversification():
                   Optimizes the portfolio by maximizing the diversification ratio.
-            - equal_risk_contribution():
-                  Optimizes the portfolio by equalizing the risk contributions across all assets.
-            - _calculate_cluster_risk(indices):
-                  Computes the risk for a given cluster of assets.
-            - _erc_objective(weights):
-                  Defines the objective function for the Equal Risk Contribution optimization.
+            - equal_risk_contribution(risk_budget, tol, max_iter):
+                  Solves the risk-budgeting problem (equal budgets by default) with a damped Newton method on the
+                  log-barrier formulation min 1/2 y'Σy - Σ b_i log(y_i), then normalizes y to weights. Iteration count
+                  and the final risk-share residual are reported in solver_info.
+            - _erc_barrier_objective(y, budget):
+                  The log-barrier objective 1/2 y'Σy - Σ b_i log(y_i) minimized by equal_risk_contribution
+                  (equal budgets by default).
+            - _volatility_gradient(weights), _neg_sharpe_gradient(weights),
+              _neg_diversification_gradient(weights), _erc_barrier_gradient(y, budget):
+                  Closed-form gradients of the SLSQP objectives and of the ERC barrier objective.
             - _calculate_risk_contributions(weights):
                   Calculates the contribution of each asset to the overall portfolio risk.
 """
@@ -38,99 +52,255 @@ Classes:
 
 import numpy as np
 import scipy.optimize as sco
-from scipy.cluster.hierarchy import linkage, leaves_list
-from scipy.spatial.distance import squareform
+import scipy.sparse as sp
+from scipy.cluster.hierarchy import leaves_list
+from .instrumentation import instrument
+
+def _finite_difference_gradient(func, x, eps=1e-6):
+    """Central finite-difference gradient, used to validate the analytic gradients."""
+    grad = np.empty_like(x)
+    step = np.zeros_like(x)
+    for i in range(x.size):
+        step[i] = eps
+        grad[i] = (func(x + step) - func(x - step)) / (2 * eps)
+        step[i] = 0.0
+    return grad
+
 
 class OptimizationMixin:
+    # Set gradient_check = True to verify every analytic gradient against finite differences before solving.
+    gradient_check = False
+    gradient_tolerance = 1e-4
+
     def _get_default_optimization_setup(self):
-        constraints = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1}
+        constraints = {'type': 'eq', 'fun': lambda x: np.sum(x) - 1, 'jac': lambda x: np.ones_like(x)}
         bounds = tuple((0, 1) for _ in range(self.num_assets))
         init_guess = np.array([1.0 / self.num_assets] * self.num_assets)
         return constraints, bounds, init_guess
 
-    def _optimize(self, objective):
+    def _optimize(self, objective, jac=None):
         constraints, bounds, init_guess = self._get_default_optimization_setup()
-        result = sco.minimize(objective, init_guess, method='SLSQP', bounds=bounds, constraints=constraints)
+        if jac is not None and self.gradient_check:
+            error = self._gradient_error(objective, jac, init_guess)
+            if error > self.gradient_tolerance:
+                raise ValueError(f"Analytic gradient disagrees with finite differences (relative error {error:.2e}).")
+        result = sco.minimize(objective, init_guess, method='SLSQP', jac=jac, bounds=bounds, constraints=constraints)
+        self.solver_info = {'nit': result.nit, 'nfev': result.nfev, 'njev': result.get('njev', 0),
+                            'converged': bool(result.success), 'message': result.message}
         self.weights = result.x
         return self.weights, *self.calculate_portfolio_performance(self.weights)
 
+    @staticmethod
+    def _gradient_error(objective, jac, weights):
+        analytic = jac(weights)
+        numeric = _finite_difference_gradient(objective, weights)
+        return np.linalg.norm(analytic - numeric) / max(1.0, np.linalg.norm(numeric))
+
+    def check_gradients(self, weights=None):
+        """Compare each analytic gradient with a finite-difference estimate at the given (or equal) weights."""
+        if weights is None:
+            weights = np.array([1.0 / self.num_assets] * self.num_assets)
+        weights = np.asarray(weights, dtype=np.float64)
+        pairs = {
+            'min_vol': (self._volatility_objective, self._volatility_gradient),
+            'max_sharpe': (self._neg_sharpe_objective, self._neg_sharpe_gradient),
+            'max_div': (self._neg_diversification_objective, self._neg_diversification_gradient),
+            'ERC': (self._erc_barrier_objective, self._erc_barrier_gradient),
+        }
+        return {key: self._gradient_error(f, g, weights) for key, (f, g) in pairs.items()}
+
+    def _volatility_objective(self, weights):
+        return self._portfolio_performance(weights)[1]
+
+    def _volatility_gradient(self, weights):
+        sigma_w = self.moments.cov_dot(weights)
+        vol = np.sqrt(np.dot(weights, sigma_w))
+        if vol == 0:
+            return np.zeros_like(weights)
+        return sigma_w / vol
+
+    def _neg_sharpe_objective(self, weights):
+        return -self._sharpe_ratio(weights)
+
+    def _neg_sharpe_gradient(self, weights):
+        moments = self.moments
+        sigma_w = moments.cov_dot(weights)
+        vol = np.sqrt(np.dot(weights, sigma_w))
+        if vol == 0:
+            return np.zeros_like(weights)
+        excess = np.dot(moments.mean, weights) - self.risk_free_rate
+        return -(moments.mean / vol - excess * sigma_w / vol ** 3)
+
+    @instrument('optimize:minimize_volatility', solver=True)
     def minimize_volatility(self):
         """Optimize portfolio to minimize volatility."""
         # Use the unrounded volatility from _portfolio_performance
-        return self._optimize(lambda x: self._portfolio_performance(x)[1])
+        return self._optimize(self._volatility_objective, jac=self._volatility_gradient)
 
+    @instrument('optimize:maximize_sharpe_ratio', solver=True)
     def maximize_sharpe_ratio(self):
         """Optimize portfolio to maximize Sharpe ratio."""
         # Use the unrounded Sharpe ratio (note the negative sign for maximization)
-        return self._optimize(lambda x: -self._sharpe_ratio(x))
+        return self._optimize(self._neg_sharpe_objective, jac=self._neg_sharpe_gradient)
 
+    @instrument('optimize:minimize_cvar', solver=True)
     def minimize_cvar(self, alpha=0.05):
         """Optimize portfolio to minimize Conditional VaR.
-        Note: Here we still use calculate_cvar, assuming the rounding only affects reporting.
-        If needed, you can similarly create an unrounded version for optimization.
+
+        Uses the Rockafellar-Uryasev formulation over the T historical scenarios, with variables
+        [w (N), VaR threshold zeta, tail excess u (T)]:
+
+            min  zeta + 1 / (alpha * T) * sum(u)
+            s.t. u_t >= -r_t' w - zeta,  u >= 0,  sum(w) = 1,  0 <= w <= 1
         """
-        return self._optimize(lambda x: self.calculate_cvar(x, alpha))
+        scenarios = np.nan_to_num(self.values.astype(np.float64, copy=False))
+        n_obs, n_assets = scenarios.shape
+        c = np.concatenate([np.zeros(n_assets), [1.0], np.full(n_obs, 1.0 / (alpha * n_obs))])
+        A_ub = sp.hstack([
+            sp.csr_matrix(-scenarios),
+            sp.csr_matrix(-np.ones((n_obs, 1))),
+            -sp.identity(n_obs, format='csr'),
+        ], format='csr')
+        b_ub = np.zeros(n_obs)
+        A_eq = sp.csr_matrix(np.concatenate([np.ones(n_assets), np.zeros(n_obs + 1)]))
+        bounds = [(0, 1)] * n_assets + [(None, None)] + [(0, None)] * n_obs
+        result = sco.linprog(c, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=[1.0], bounds=bounds, method='highs')
+        if result.status != 0:
+            raise ValueError(f"Minimum CVaR linear program failed: {result.message}")
+        self.solver_info = {'nit': result.nit, 'converged': True, 'message': result.message, 'cvar': result.fun}
+        weights = np.clip(result.x[:n_assets], 0, None)
+        self.weights = weights / np.sum(weights)
+        return self.weights, *self.calculate_portfolio_performance(self.weights)
 
+    @instrument('optimize:equal_weight', solver=True)
     def equal_weight(self):
         """Construct an equal weight portfolio."""
         weights = np.array([1.0 / self.num_assets] * self.num_assets)
+        self.solver_info = {}
         self.weights = weights
         return self.weights, *self.calculate_portfolio_performance(weights)
 
-    def hierarchical_risk_parity(self):
+    @instrument('optimize:hierarchical_risk_parity', solver=True)
+    def hierarchical_risk_parity(self, linkage_method='single'):
         """Optimize portfolio using Hierarchical Risk Parity (HRP)."""
-        corr = self.returns.corr()
-        dist = np.sqrt(0.5 * (1 - corr))
-        dist_condensed = squareform(dist.values, checks=False)
-        link = linkage(dist_condensed, method='single')
-        order = list(leaves_list(link))
+        moments = self.moments
+        order = leaves_list(moments.linkage(linkage_method))
+        # Work in the quasi-diagonal order so every cluster is a contiguous block of a single permuted covariance.
+        cov = moments.cov[np.ix_(order, order)]
+        variances = np.diag(cov)
+        inv_var = np.divide(1.0, variances, out=np.zeros_like(variances), where=variances > 0)
         weights = np.ones(self.num_assets)
-        clusters = [order]
+        clusters = [(0, self.num_assets)]
         while clusters:
-            cluster = clusters.pop(0)
-            if len(cluster) > 1:
-                mid = len(cluster) // 2
-                left = cluster[:mid]
-                right = cluster[mid:]
-                left_risk = self._calculate_cluster_risk(left)
-                right_risk = self._calculate_cluster_risk(right)
-                alloc_factor = 1.0 - left_risk / (left_risk + right_risk)
-                for i in left:
-                    weights[i] *= alloc_factor
-                for i in right:
-                    weights[i] *= (1 - alloc_factor)
-                clusters.append(left)
-                clusters.append(right)
-        weights /= np.sum(weights)
-        self.weights = weights
-        return self.weights, *self.calculate_portfolio_performance(weights)
+            splits = []
+            for start, stop in clusters:
+                if stop - start > 1:
+                    mid = (start + stop) // 2
+                    splits.append((start, mid, stop))
+            clusters = []
+            for start, mid, stop in splits:
+                left_var = self._cluster_variance(cov, inv_var, start, mid)
+                right_var = self._cluster_variance(cov, inv_var, mid, stop)
+                total = left_var + right_var
+                alloc_factor = 0.5 if total == 0 else 1.0 - left_var / total
+                weights[start:mid] *= alloc_factor
+                weights[mid:stop] *= 1 - alloc_factor
+                clusters.append((start, mid))
+                clusters.append((mid, stop))
+        hrp_weights = np.empty(self.num_assets)
+        hrp_weights[order] = weights / np.sum(weights)
+        self.solver_info = {}
+        self.weights = hrp_weights
+        return self.weights, *self.calculate_portfolio_performance(hrp_weights)
 
+    @instrument('optimize:maximum_diversification', solver=True)
     def maximum_diversification(self):
         """Optimize portfolio by maximizing the diversification ratio."""
-        sigma = self.returns.std() * np.sqrt(252)
-        def objective(w):
-            port_vol = np.sqrt(np.dot(w.T, np.dot(self.cov_matrix, w)))
-            return -np.dot(w, sigma) / port_vol  # Negative for maximization
-        return self._optimize(objective)
-
-    def equal_risk_contribution(self):
-        """Optimize portfolio using Equal Risk Contribution (ERC)."""
-        return self._optimize(lambda x: self._erc_objective(x))
-
-    def _calculate_cluster_risk(self, indices):
-        cov = self.returns.cov() * 252
-        cluster_weights = np.ones(len(indices))
-        cluster_weights /= np.sum(cluster_weights)
-        cluster_cov = cov.iloc[indices, indices]
-        risk = np.sqrt(np.dot(cluster_weights.T, np.dot(cluster_cov, cluster_weights)))
-        return risk
-
-    def _erc_objective(self, weights):
-        risk_contrib = self._calculate_risk_contributions(weights)
-        return np.sum((risk_contrib - np.mean(risk_contrib)) ** 2)
+        return self._optimize(self._neg_diversification_objective, jac=self._neg_diversification_gradient)
+
+    def _neg_diversification_objective(self, weights):
+        moments = self.moments
+        port_vol = np.sqrt(moments.variance(weights))
+        return -np.dot(weights, moments.std) / port_vol  # Negative for maximization
+
+    def _neg_diversification_gradient(self, weights):
+        moments = self.moments
+        sigma_w = moments.cov_dot(weights)
+        vol = np.sqrt(np.dot(weights, sigma_w))
+        return -(moments.std / vol - np.dot(weights, moments.std) * sigma_w / vol ** 3)
+
+    @instrument('optimize:equal_risk_contribution', solver=True)
+    def equal_risk_contribution(self, risk_budget=None, tol=1e-10, max_iter=100):
+        """Optimize portfolio using Equal Risk Contribution (ERC), or general risk budgets when given."""
+        moments = self.moments
+        if risk_budget is None:
+            budget = np.full(self.num_assets, 1.0 / self.num_assets)
+        else:
+            budget = np.asarray(risk_budget, dtype=np.float64)
+            if budget.shape != (self.num_assets,) or np.any(budget <= 0):
+                raise ValueError("Risk budget must hold one positive value per asset.")
+            budget = budget / np.sum(budget)
+
+        # At the optimum y_i (Σy)_i = b_i and y'Σy = 1, so start from inverse volatilities scaled onto that sphere.
+        y = budget / np.where(moments.std > 0, moments.std, 1.0)
+        y /= np.sqrt(moments.variance(y))
+        nit = 0
+        stalled = False
+        while True:
+            sigma_y = moments.cov_dot(y)
+            residual = np.max(np.abs(y * sigma_y / np.dot(y, sigma_y) - budget))
+            if residual < tol or nit == max_iter or stalled:
+                break
+            grad = self._erc_barrier_gradient(y, budget)
+            step_dir = -moments.solve_shifted(budget / y ** 2, grad)
+            # Fraction-to-boundary rule keeps y strictly positive, then Armijo backtracking on the barrier objective.
+            shrinking = step_dir < 0
+            step = min(1.0, 0.99 * np.min(-y[shrinking] / step_dir[shrinking])) if shrinking.any() else 1.0
+            f0 = self._erc_barrier_objective(y, budget)
+            slope = np.dot(grad, step_dir)
+            y_new, accepted = y, False
+            while step > 1e-12:
+                trial = y + step * step_dir
+                if self._erc_barrier_objective(trial, budget) <= f0 + 1e-4 * step * slope:
+                    y_new, accepted = trial, True
+                    break
+                step *= 0.5
+            if not accepted:
+                # No step satisfies the Armijo condition: keep the current iterate and report non-convergence.
+                stalled = True
+                continue
+            y = y_new
+            nit += 1
+
+        self.solver_info = {'nit': nit, 'residual': float(residual), 'converged': bool(residual < tol)}
+        if stalled:
+            self.solver_info['message'] = 'Line search failed to find a decreasing step.'
+        self.weights = y / np.sum(y)
+        return self.weights, *self.calculate_portfolio_performance(self.weights)
+
+    @staticmethod
+    def _cluster_variance(cov, inv_var, start, stop):
+        """Variance of the inverse-variance portfolio of the contiguous cluster [start, stop) of cov."""
+        w = inv_var[start:stop]
+        total = np.sum(w)
+        if total == 0:
+            return 0.0
+        w = w / total
+        return float(w @ cov[start:stop, start:stop] @ w)
+
+    def _erc_barrier_objective(self, y, budget=None):
+        if budget is None:
+            budget = np.full(self.num_assets, 1.0 / self.num_assets)
+        return 0.5 * self.moments.variance(y) - np.dot(budget, np.log(y))
+
+    def _erc_barrier_gradient(self, y, budget=None):
+        if budget is None:
+            budget = np.full(self.num_assets, 1.0 / self.num_assets)
+        return self.moments.cov_dot(y) - budget / y
 
     def _calculate_risk_contributions(self, weights):
-        cov_matrix = self.returns.cov() * 252
-        port_vol = np.sqrt(np.dot(weights.T, np.dot(cov_matrix, weights)))
-        marginal = np.dot(cov_matrix, weights) / port_vol
+        weights = np.asarray(weights, dtype=np.float64)
+        sigma_w = self.moments.cov_dot(weights)
+        port_vol = np.sqrt(np.dot(weights, sigma_w))
+        marginal = sigma_w / port_vol
         return weights * marginal
\ No newline at end of file
@@ -0,0 +1,62 @@
+"""
+Module: parallel.py
+
+Purpose:
+    Runs independent backtest cells in a process pool. The returns matrix is published once through
+    multiprocessing.shared_memory and every worker builds its optimizer on a view of that block, so the
+    data is never pickled per task.
+
+Functions:
+    - run_cells(optimizer, cells, max_workers):
+          Evaluates (method, train_window, rebalance_period) cells with optimizer._sensitivity_cell,
+          in a ProcessPoolExecutor when max_workers > 1, and returns the results in the order of cells.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+
+_WORKER = {}
+
+
+def _init_worker(shm_name, shape, dtype, index, columns, optimizer_cls, risk_free_rate, cov_estimator,
+                 cov_override):
+    # Workers are children of the publishing process and share its resource tracker, so attaching here does not
+    # transfer ownership; the parent unlinks the block once the pool has shut down.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    returns = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    optimizer = optimizer_cls(returns, risk_free_rate=risk_free_rate, cov_estimator=cov_estimator, dtype=dtype,
+                              copy=False)
+    if cov_override is not None:
+        optimizer.cov_matrix = cov_override
+    _WORKER['shm'] = shm
+    _WORKER['optimizer'] = optimizer
+
+
+def _run_cell(cell):
+    return _WORKER['optimizer']._sensitivity_cell(*cell)
+
+
+def run_cells(optimizer, cells, max_workers=None):
+    """Evaluate backtest cells, in parallel when more than one worker is requested, preserving input order."""
+    cells = list(cells)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(cells))
+    if max_workers <= 1:
+        return [optimizer._sensitivity_cell(*cell) for cell in cells]
+
+    values = optimizer.values
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        initargs = (shm.name, values.shape, values.dtype, optimizer.index, optimizer.columns,
+                    type(optimizer), optimizer.risk_free_rate, optimizer.cov_estimator, optimizer._cov_override)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=initargs) as pool:
+            return list(pool.map(_run_cell, cells))
+    finally:
+        shm.close()
+        shm.unlink()
@@ -0,0 +1,114 @@
+"""
+Module: plot_json.py
+
+Purpose:
+    Serializes Plotly figures into a compact JSON payload for rendering in the browser with plotly.js, so the server
+    does not have to rasterize them. Floats are trimmed to a fixed number of significant digits, and any array or
+    layout template that occurs more than once across the figures of a payload (the shared date axis of the
+    cumulative-return charts, the asset names, the default template) is stored once and referenced as {"$ref": id}.
+
+Classes:
+    PlotPayload:
+        Constructor:
+            - __init__(digits, min_shared):
+                  Sets the significant digits kept for floats and the minimum length of an array worth sharing.
+        Methods:
+            - add(fig):
+                  Adds a figure and returns its id within the payload.
+            - to_dict():
+                  Returns {'figures': {id: {'data', 'layout'}}, 'shared': {ref: value}}, ready for json.dumps.
+"""
+
+import base64
+import hashlib
+import json
+import math
+import numpy as np
+
+
+def _decode_typed_array(node):
+    values = np.frombuffer(base64.b64decode(node['bdata']), dtype=np.dtype(node['dtype']))
+    if 'shape' in node:
+        shape = node['shape']
+        shape = tuple(int(s) for s in shape.split(',')) if isinstance(shape, str) else tuple(shape)
+        values = values.reshape(shape)
+    return values
+
+
+class PlotPayload:
+    def __init__(self, digits=4, min_shared=8):
+        self.digits = digits
+        self.min_shared = min_shared
+        self._figures = {}
+        self._shared = {}
+        self._counts = {}
+
+    def _float(self, value):
+        if value is None or not math.isfinite(value):
+            return None
+        return float(f"{value:.{self.digits}g}")
+
+    def _array(self, values):
+        values = np.asarray(values)
+        if values.dtype.kind == 'M':
+            result = np.datetime_as_string(values, unit='auto').tolist()
+        elif values.dtype.kind == 'f':
+            result = self._nested_floats(values.tolist())
+        elif values.dtype.kind in 'iub':
+            result = values.tolist()
+        else:
+            result = [self._compact(v) for v in values.tolist()]
+        return result
+
+    def _nested_floats(self, values):
+        return [self._nested_floats(v) if isinstance(v, list) else self._float(v) for v in values]
+
+    def _share(self, value):
+        """Store a large value once and return a reference to it."""
+        text = json.dumps(value, separators=(',', ':'), sort_keys=True)
+        ref = hashlib.sha1(text.encode()).hexdigest()[:12]
+        self._shared.setdefault(ref, value)
+        self._counts[ref] = self._counts.get(ref, 0) + 1
+        return {'$ref': ref}
+
+    def _compact(self, node):
+        if isinstance(node, dict):
+            if 'bdata' in node and 'dtype' in node:
+                return self._compact(_decode_typed_array(node))
+            return {key: self._compact(value) for key, value in node.items()}
+        if isinstance(node, (np.ndarray, list, tuple)):
+            values = self._array(node) if isinstance(node, np.ndarray) else [self._compact(v) for v in node]
+            return self._share(values) if len(values) >= self.min_shared else values
+        if isinstance(node, (float, np.floating)):
+            return self._float(float(node))
+        if isinstance(node, np.integer):
+            return int(node)
+        if isinstance(node, np.bool_):
+            return bool(node)
+        return node
+
+    def add(self, fig):
+        spec = fig.to_plotly_json()
+        layout = dict(spec.get('layout', {}))
+        template = layout.pop('template', None)
+        figure = {'data': self._compact(spec.get('data', [])), 'layout': self._compact(layout)}
+        if template is not None:
+            figure['layout']['template'] = self._share(self._compact(template))
+        figure_id = f"fig{len(self._figures)}"
+        self._figures[figure_id] = figure
+        return figure_id
+
+    def to_dict(self):
+        # References used only once are inlined again; sharing only pays off for repeated values.
+        def inline(node):
+            if isinstance(node, dict):
+                if set(node) == {'$ref'} and self._counts[node['$ref']] == 1:
+                    return inline(self._shared[node['$ref']])
+                return {key: inline(value) for key, value in node.items()}
+            if isinstance(node, list):
+                return [inline(v) for v in node]
+            return node
+
+        figures = {figure_id: inline(figure) for figure_id, figure in self._figures.items()}
+        shared = {ref: inline(value) for ref, value in self._shared.items() if self._counts[ref] > 1}
+        return {'figures': figures, 'shared': shared}
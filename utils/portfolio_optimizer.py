@@ -7,46 +7,151 @@ Purpose:
     metrics calculations, and various utility functions.
 
 Classes:
-    PortfolioOptimizer (inherits from MetricsMixin, OptimizationMixin, VisualizationMixin, BacktestingMixin, UtilityMixin):
+    PortfolioOptimizer (inherits from MetricsMixin, OptimizationMixin, FrontierMixin, SimulationMixin, VisualizationMixin,
+                        BacktestingMixin, UtilityMixin):
         Constructor:
-            - __init__(returns, risk_free_rate, cov_estimator):
-                  Initializes the optimizer with asset return data, sets the risk-free rate, and computes the covariance matrix.
+            - __init__(returns, risk_free_rate, cov_estimator, dtype, copy, compact):
+                  Initializes the optimizer with asset return data and sets the risk-free rate.
                   Ensures that the returns have a DateTime index and are sorted chronologically.
+                  dtype (float64 by default, or float32) is the storage type of the returns array. With
+                  copy=False the returns are not copied up front when pandas' copy-on-write is active (always on
+                  pandas >= 3, opt-in on 2.x), since it keeps later in-place edits of the caller's frame from
+                  reaching the optimizer; without copy-on-write they are copied anyway so the cached moments cannot
+                  go stale. compact=True implies float32 storage and copy=False, and keeps a single float32 block
+                  shared by `returns` and `values`, roughly halving the memory of large universes.
+        Properties:
+            - returns, cov_estimator:
+                  Assigning either drops the cached moments (and any explicit covariance override). Estimators are
+                  provided by utils/covariance.py; a factor-model estimator keeps the moments in low-rank form.
+            - values, columns, index:
+                  The returns as a contiguous (T x N) ndarray of `dtype`, built once and reused by every metric and
+                  objective, together with the asset labels and dates needed to rebuild pandas objects for reporting.
+            - moments:
+                  Lazily computed Moments cache (annualized mean, covariance, volatility and correlation arrays)
+                  shared by every metric and optimization objective.
+            - cov_matrix:
+                  The annualized covariance as a DataFrame. Assigning it overrides the covariance used by all
+                  metrics and objectives until the returns or the estimator change.
         Methods:
             - add_weights(opt):
                   Adds the computed weights from a given optimization method to an internal dictionary (weight_list) for further use.
+            - invalidate_moments():
+                  Drops the cached moments and returns array, e.g. after mutating the returns DataFrame in place.
+            - set_moments(mean, cov):
+                  Installs precomputed annualized moments (e.g. from a rolling-window engine) as the cache.
 """
 
 
+import numpy as np
 import pandas as pd
+from .moments import Moments, compute_moments
 from .metrics import MetricsMixin
 from .optimization import OptimizationMixin
+from .frontier import FrontierMixin
+from .simulation import SimulationMixin
 from .visualization import VisualizationMixin
 from .backtesting import BacktestingMixin
 from .utilities import UtilityMixin
 
+def _copy_on_write():
+    return int(pd.__version__.split('.')[0]) >= 3 or pd.get_option('mode.copy_on_write') is True
+
+
 class PortfolioOptimizer(MetricsMixin, 
                          OptimizationMixin, 
+                         FrontierMixin,
+                         SimulationMixin,
                          VisualizationMixin, 
                          BacktestingMixin, 
                          UtilityMixin):
-    def __init__(self, returns, risk_free_rate=0.0, cov_estimator=None):
+    def __init__(self, returns, risk_free_rate=0.0, cov_estimator=None, dtype=np.float64, copy=True,
+                 compact=False):
         """
         Initialize the PortfolioOptimizer with asset returns and settings.
         """
-        self.returns = returns.copy()
-        if not isinstance(self.returns.index, pd.DatetimeIndex):
-            self.returns.index = pd.to_datetime(self.returns.index)
-        self.returns.sort_index(inplace=True)
+        if compact:
+            dtype, copy = np.float32, False
+        # The compact conversion below always allocates a new block, so only the plain path needs the copy.
+        returns = returns.copy(deep=copy or (not compact and not _copy_on_write()))
+        if not isinstance(returns.index, pd.DatetimeIndex):
+            returns.index = pd.to_datetime(returns.index)
+        if not returns.index.is_monotonic_increasing:
+            returns = returns.sort_index()
+        if compact:
+            values = np.ascontiguousarray(returns.to_numpy(dtype=np.float32))
+            returns = pd.DataFrame(values, index=returns.index, columns=returns.columns, copy=False)
+        self._cov_estimator = cov_estimator
+        self.dtype = np.dtype(dtype)
+        self.compact = compact
+        self.returns = returns
         self.risk_free_rate = risk_free_rate
-        self.num_assets = self.returns.shape[1]
         self.weights = None
+        self.solver_info = {}
         self.weight_history = {}
         self.weight_list={}
-        if cov_estimator is None:
-            self.cov_matrix = self.returns.cov() * 252
-        else:
-            self.cov_matrix = cov_estimator(self.returns)
+
+    @property
+    def returns(self):
+        return self._returns
+
+    @returns.setter
+    def returns(self, returns):
+        self._returns = returns
+        self.num_assets = returns.shape[1]
+        self._cov_override = None
+        self.invalidate_moments()
+
+    @property
+    def cov_estimator(self):
+        return self._cov_estimator
+
+    @cov_estimator.setter
+    def cov_estimator(self, cov_estimator):
+        self._cov_estimator = cov_estimator
+        self._cov_override = None
+        self.invalidate_moments()
+
+    @property
+    def moments(self):
+        """Annualized moments of the current returns, computed once and reused until invalidated."""
+        if self._moments is None:
+            self._moments = compute_moments(self._returns, self._cov_estimator, self._cov_override,
+                                            values=self.values)
+        return self._moments
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = np.ascontiguousarray(self._returns.to_numpy(dtype=self.dtype))
+        return self._values
+
+    @property
+    def columns(self):
+        return self._returns.columns
+
+    @property
+    def index(self):
+        return self._returns.index
+
+    @property
+    def cov_matrix(self):
+        columns = self._returns.columns
+        return pd.DataFrame(self.moments.cov, index=columns, columns=columns)
+
+    @cov_matrix.setter
+    def cov_matrix(self, cov_matrix):
+        if isinstance(cov_matrix, pd.DataFrame):
+            columns = self._returns.columns
+            cov_matrix = cov_matrix.loc[columns, columns]
+        self._cov_override = np.asarray(cov_matrix, dtype=np.float64)
+        self.invalidate_moments()
+
+    def invalidate_moments(self):
+        self._moments = None
+        self._values = None
+
+    def set_moments(self, mean, cov):
+        self._moments = Moments(mean, cov)
 
     def add_weights(self, opt):
         self.weight_list[opt]=self.weights
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Module: price_cache.py
+
+Purpose:
+    Provides an on-disk, per-ticker store of daily closing prices so that repeated runs over overlapping tickers and
+    date ranges only fetch the bars that are not already cached. Each symbol is kept as a memory-mapped NumPy record
+    array (date, close) plus a JSON sidecar listing the date ranges already fetched, guarded by a file lock so that
+    concurrent workers can share one cache directory.
+
+Classes and Functions:
+    normalize_symbols(tickers):
+        Upper-cases and strips the symbols and drops duplicates, keeping the first-seen order.
+    YFinanceProvider:
+        Methods:
+            - fetch(tickers, start, end):
+                  Downloads closing prices for [start, end) through yfinance.download.
+    FrameProvider:
+        Constructor:
+            - __init__(prices):
+                  Wraps a DataFrame of closing prices (DatetimeIndex x tickers); an offline stand-in for Yahoo Finance.
+        Methods:
+            - fetch(tickers, start, end):
+                  Returns the wrapped prices for [start, end) and records the call in `calls`.
+    PriceCache:
+        Constructor:
+            - __init__(root, provider):
+                  Uses `root` as the cache directory and `provider` (default YFinanceProvider) for missing ranges.
+        Methods:
+            - get(tickers, start, end):
+                  Returns a DataFrame of closing prices for [start, end), fetching only uncovered ranges, grouped so
+                  that tickers missing the same range are requested from the provider in one call. Symbols are
+                  upper-cased and de-duplicated (as Yahoo Finance does), so the columns are the normalized symbols.
+            - missing_ranges(ticker, start, end):
+                  Lists the [start, end) day ranges of the request that are not yet cached for a ticker.
+"""
+
+import json
+import os
+from contextlib import contextmanager
+from datetime import date
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_RECORD = np.dtype([('date', '<i8'), ('close', '<f8')])
+
+
+@contextmanager
+def _locked(path, exclusive=True):
+    """Hold an advisory lock on `path` for the duration of the block."""
+    with open(path, 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _day(value):
+    return int(np.datetime64(pd.Timestamp(value).normalize().date(), 'D').astype(np.int64))
+
+
+def _timestamp(day):
+    return pd.Timestamp(np.datetime64(day, 'D'))
+
+
+def _merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class YFinanceProvider:
+    def fetch(self, tickers, start, end):
+        import yfinance as yf
+        data = yf.download(list(tickers), start=start, end=end, progress=False)
+        close = data['Close']
+        if isinstance(close, pd.Series):
+            close = close.to_frame(tickers[0])
+        return close
+
+
+class FrameProvider:
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def fetch(self, tickers, start, end):
+        self.calls.append((tuple(tickers), start, end))
+        prices = self.prices.reindex(columns=list(tickers))
+        return prices[(prices.index >= pd.Timestamp(start)) & (prices.index < pd.Timestamp(end))]
+
+
+def normalize_symbols(tickers):
+    """Upper-cased, stripped symbols in their first-seen order, without duplicates."""
+    return list(dict.fromkeys(t.strip().upper() for t in tickers))
+
+
+class PriceCache:
+    def __init__(self, root, provider=None):
+        self.root = root
+        self.provider = provider if provider is not None else YFinanceProvider()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, ticker, suffix):
+        safe = ticker.replace(os.sep, '_').replace(':', '_')
+        return os.path.join(self.root, f"{safe}{suffix}")
+
+    def _coverage(self, ticker):
+        try:
+            with open(self._path(ticker, '.json')) as f:
+                return json.load(f)['coverage']
+        except FileNotFoundError:
+            return []
+
+    def _records(self, ticker):
+        try:
+            return np.load(self._path(ticker, '.npy'), mmap_mode='r')
+        except FileNotFoundError:
+            return np.empty(0, dtype=_RECORD)
+
+    def missing_ranges(self, ticker, start, end):
+        """Uncovered [start, end) day ranges (as day numbers) of the request for one ticker."""
+        missing, cursor = [], start
+        for lo, hi in self._coverage(ticker):
+            if hi <= cursor:
+                continue
+            if lo >= end:
+                break
+            if lo > cursor:
+                missing.append((cursor, lo))
+            cursor = max(cursor, hi)
+        if cursor < end:
+            missing.append((cursor, end))
+        return missing
+
+    def _store(self, ticker, frame_column, start, end):
+        """Merge fetched closes for [start, end) into the ticker's records and mark the range as covered.
+
+        An empty (or all-NaN) column is treated as a failed download: nothing is stored, so the range is requested
+        again on the next call instead of being cached as missing.
+        """
+        values = frame_column.dropna()
+        if values.empty:
+            return
+        new = np.empty(len(values), dtype=_RECORD)
+        new['date'] = values.index.values.astype('datetime64[D]').astype(np.int64)
+        new['close'] = values.to_numpy(dtype=np.float64)
+        with _locked(self._path(ticker, '.lock')):
+            old = np.array(self._records(ticker))
+            old = old[(old['date'] < start) | (old['date'] >= end)]
+            records = np.concatenate([old, new])
+            records = records[np.argsort(records['date'], kind='stable')]
+            tmp = self._path(ticker, '.npy.tmp')
+            with open(tmp, 'wb') as f:
+                np.save(f, records)
+            os.replace(tmp, self._path(ticker, '.npy'))
+            # Bars for the current day may still change, so coverage never extends past yesterday.
+            covered_end = min(end, _day(date.today()))
+            coverage = self._coverage(ticker)
+            if covered_end > start:
+                coverage = _merge_ranges(coverage + [[start, covered_end]])
+            tmp = self._path(ticker, '.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump({'coverage': coverage}, f)
+            os.replace(tmp, self._path(ticker, '.json'))
+
+    def get(self, tickers, start, end):
+        """Closing prices for [start, end) as a DataFrame, fetching only what the cache does not hold."""
+        tickers = normalize_symbols(tickers)
+        start_day, end_day = _day(start), _day(end)
+
+        requests = {}
+        for ticker in tickers:
+            with _locked(self._path(ticker, '.lock'), exclusive=False):
+                missing = self.missing_ranges(ticker, start_day, end_day)
+            for lo, hi in missing:
+                requests.setdefault((lo, hi), []).append(ticker)
+        for (lo, hi), group in requests.items():
+            fetched = self.provider.fetch(group, _timestamp(lo), _timestamp(hi))
+            for ticker in group:
+                column = fetched[ticker] if ticker in fetched.columns else pd.Series(dtype=np.float64)
+                self._store(ticker, column, lo, hi)
+
+        columns = {}
+        for ticker in tickers:
+            with _locked(self._path(ticker, '.lock'), exclusive=False):
+                records = self._records(ticker)
+                lo, hi = np.searchsorted(records['date'], [start_day, end_day])
+                window = np.array(records[lo:hi])
+            index = pd.DatetimeIndex(window['date'].astype('datetime64[D]').astype('datetime64[ns]'), name='Date')
+            columns[ticker] = pd.Series(window['close'], index=index)
+        prices = pd.DataFrame(columns, columns=tickers)
+        prices.columns.name = 'Ticker'
+        return prices
@@ -0,0 +1,148 @@
+"""
+Module: rendering.py
+
+Purpose:
+    Renders many Plotly figures to image files in one go. Work is spread over a small process pool in which every
+    worker opens one Kaleido session and reuses it for all the figures it is given, instead of paying the engine
+    start-up cost per figure. A manifest of figure-spec hashes next to the images lets unchanged figures be
+    skipped on the next run.
+
+Functions:
+    - render_figures(jobs, processes, manifest):
+          Renders (figure, path) pairs and returns one record per job with the path, render time in seconds,
+          whether it was skipped as unchanged, and any error.
+    - render_report(records):
+          Formats the records as a per-figure timing table with a total line.
+"""
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from .instrumentation import PROFILER, instrument
+
+MANIFEST_NAME = '.render-manifest.json'
+
+_SESSION = {}
+
+
+def _open_session():
+    """Start one Kaleido session for this process: a persistent PlotlyScope on Kaleido < 1, otherwise the sync
+    server that plotly.io.to_image reuses between calls."""
+    try:
+        from kaleido.scopes.plotly import PlotlyScope
+        scope = PlotlyScope()
+        _SESSION['render'] = lambda spec, fmt: scope.transform(json.loads(spec), format=fmt)
+        return
+    except Exception:
+        pass
+    import plotly.io as pio
+    try:
+        import kaleido
+        if hasattr(kaleido, 'start_sync_server'):
+            kaleido.start_sync_server(silence_warnings=True)
+    except Exception:
+        pass
+    _SESSION['render'] = lambda spec, fmt: pio.to_image(pio.from_json(spec), format=fmt)
+
+
+def _render_batch(batch):
+    if 'render' not in _SESSION:
+        _open_session()
+    records = []
+    for spec, path in batch:
+        fmt = os.path.splitext(path)[1].lstrip('.').lower() or 'png'
+        start = time.perf_counter()
+        try:
+            image = _SESSION['render'](spec, fmt)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(image)
+            os.replace(tmp, path)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        records.append({'path': path, 'seconds': time.perf_counter() - start, 'skipped': False, 'error': error})
+    return records
+
+
+def _spec_hash(spec, path):
+    return hashlib.sha256(f"{os.path.splitext(path)[1]}\n{spec}".encode()).hexdigest()
+
+
+def _load_manifest(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@instrument('render:render_figures')
+def render_figures(jobs, processes=None, manifest=True):
+    """Render (figure, path) pairs in pooled Kaleido sessions, skipping figures whose spec has not changed."""
+    jobs = [(fig.to_json(), path) for fig, path in jobs]
+    records, pending, hashes = {}, [], {}
+    manifests = {}
+    for spec, path in jobs:
+        directory = os.path.dirname(os.path.abspath(path))
+        if directory not in manifests:
+            manifests[directory] = _load_manifest(os.path.join(directory, MANIFEST_NAME)) if manifest else {}
+        key = _spec_hash(spec, path)
+        hashes[path] = key
+        name = os.path.basename(path)
+        if manifest and manifests[directory].get(name) == key and os.path.exists(path):
+            records[path] = {'path': path, 'seconds': 0.0, 'skipped': True, 'error': None}
+        else:
+            pending.append((spec, path))
+
+    if pending:
+        if processes is None:
+            processes = min(4, os.cpu_count() or 1)
+        processes = max(1, min(processes, len(pending)))
+        # One batch per worker, so each worker opens its Kaleido session once.
+        batches = [pending[i::processes] for i in range(processes)]
+        if processes == 1:
+            rendered = [_render_batch(pending)]
+        else:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                rendered = list(pool.map(_render_batch, batches))
+        for batch in rendered:
+            for record in batch:
+                records[record['path']] = record
+                # Figures are rendered in worker processes, so their timings are recorded here.
+                PROFILER.record('render:figure', record['seconds'], failed=int(record['error'] is not None))
+
+    if manifest:
+        for directory, entries in manifests.items():
+            for spec, path in jobs:
+                if os.path.dirname(os.path.abspath(path)) == directory:
+                    if records[path]['error'] is None:
+                        entries[os.path.basename(path)] = hashes[path]
+                    else:
+                        entries.pop(os.path.basename(path), None)
+            tmp = os.path.join(directory, f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, sort_keys=True)
+            os.replace(tmp, os.path.join(directory, MANIFEST_NAME))
+    return [records[path] for _, path in jobs]
+
+
+def render_report(records):
+    lines = [f"{'Figure':<60} {'Seconds':>8}  Status"]
+    for record in records:
+        if record['skipped']:
+            status = 'skipped'
+        elif record['error']:
+            status = 'failed: ' + ' '.join(record['error'].split())[:80]
+        else:
+            status = 'rendered'
+        lines.append(f"{record['path']:<60} {record['seconds']:>8.3f}  {status}")
+    rendered = sum(1 for r in records if not r['skipped'] and r['error'] is None)
+    skipped = sum(1 for r in records if r['skipped'])
+    failed = sum(1 for r in records if r['error'])
+    total = sum(r['seconds'] for r in records)
+    lines.append(f"{len(records)} figures: {rendered} rendered, {skipped} unchanged, {failed} failed, "
+                 f"{total:.3f}s render time")
+    return '\n'.join(lines)
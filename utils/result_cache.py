@@ -0,0 +1,172 @@
+"""
+Module: result_cache.py
+
+Purpose:
+    Content-addressed cache for analysis results. Entries are keyed by a SHA-256 fingerprint of the returns matrix
+    and the parameters that produced them, so identical submissions share results no matter who sent them. Values
+    are pickled into a bounded in-memory LRU tier and, optionally, an on-disk tier that several server processes can
+    share.
+
+Classes and Functions:
+    fingerprint(returns, **params):
+        Returns a hex digest covering the returns values, index and columns plus the given parameters.
+    ResultCache:
+        Constructor:
+            - __init__(max_items, max_bytes, disk_dir, disk_max_bytes):
+                  Sets the limits of the memory tier and, when disk_dir is given, enables the disk tier.
+        Methods:
+            - get(key, default):
+                  Returns the cached value from memory or disk (promoting disk hits into memory), or default.
+            - set(key, value):
+                  Stores a value in both tiers and evicts least recently used entries beyond the limits.
+            - get_or_compute(key, compute, validate):
+                  Returns the cached value if present and accepted by validate(value), otherwise computes, stores
+                  and returns compute().
+            - stats():
+                  Returns hit, miss and eviction counters together with the current size of each tier.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+_MISSING = object()
+
+
+def fingerprint(returns, **params):
+    digest = hashlib.sha256()
+    values = np.ascontiguousarray(returns.to_numpy(dtype=np.float64))
+    digest.update(repr(values.shape).encode())
+    digest.update(values.tobytes())
+    digest.update(returns.index.astype(str).str.cat(sep='|').encode())
+    digest.update('|'.join(map(str, returns.columns)).encode())
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_items=128, max_bytes=64 * 2**20, disk_dir=None, disk_max_bytes=512 * 2**20):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        if disk_dir is not None:
+            os.makedirs(disk_dir, exist_ok=True)
+        self._memory = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0,
+                          'disk_evictions': 0, 'rejected': 0}
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _remember(self, key, blob):
+        # Caller holds the lock.
+        if key in self._memory:
+            self._bytes -= len(self._memory.pop(key))
+        if len(blob) > self.max_bytes:
+            return
+        self._memory[key] = blob
+        self._bytes += len(blob)
+        while len(self._memory) > self.max_items or self._bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._bytes -= len(evicted)
+            self._counters['evictions'] += 1
+
+    def _read_disk(self, key):
+        if self.disk_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as f:
+                blob = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return blob
+
+    def _write_disk(self, key, blob):
+        if self.disk_dir is None:
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(blob)
+        os.replace(tmp, self._disk_path(key))
+        self._evict_disk()
+
+    def _disk_entries(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.pkl'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            with self._lock:
+                self._counters['disk_evictions'] += 1
+
+    def get(self, key, default=None):
+        with self._lock:
+            blob = self._memory.get(key)
+            if blob is not None:
+                self._memory.move_to_end(key)
+                self._counters['memory_hits'] += 1
+                return pickle.loads(blob)
+        blob = self._read_disk(key)
+        with self._lock:
+            if blob is None:
+                self._counters['misses'] += 1
+                return default
+            self._counters['disk_hits'] += 1
+            self._remember(key, blob)
+        return pickle.loads(blob)
+
+    def set(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(key, blob)
+            self._counters['stores'] += 1
+        self._write_disk(key, blob)
+
+    def get_or_compute(self, key, compute, validate=None):
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            if validate is None or validate(value):
+                return value
+            with self._lock:
+                self._counters['rejected'] += 1
+        value = compute()
+        self.set(key, value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters, memory_items=len(self._memory), memory_bytes=self._bytes)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        # Entries rejected by a validator were found but not used, so they do not count towards the hit rate.
+        served = stats['memory_hits'] + stats['disk_hits'] - stats['rejected']
+        stats['hit_rate'] = served / lookups if lookups else 0.0
+        if self.disk_dir is not None:
+            entries = self._disk_entries()
+            stats.update(disk_items=len(entries), disk_bytes=sum(size for _, size, _ in entries))
+        return stats
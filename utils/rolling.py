@@ -0,0 +1,67 @@
+"""
+Module: rolling.py
+
+Purpose:
+    Maintains the mean and covariance of a sliding window over a returns matrix incrementally, so that
+    walk-forward backtests pay O(k·N²) per rebalance for k new rows instead of O(T·N²) for a full recomputation.
+
+Classes:
+    RollingMoments:
+        Constructor:
+            - __init__(data, window, refresh_every):
+                  Wraps a (T x N) returns array and the window length. float32 data is kept as is (only the rows
+                  entering or leaving the window are converted); the accumulators are always float64 and are
+                  rebuilt from scratch every refresh_every incremental updates to bound floating-point drift.
+        Methods:
+            - moments(start):
+                  Returns the daily mean vector and sample covariance matrix of rows [start, start + window).
+                  Moving forward by fewer than window rows adds the new rows to and removes the old rows from
+                  the sum and cross-product accumulators; any other move triggers a full rebuild.
+"""
+
+import numpy as np
+
+
+class RollingMoments:
+    def __init__(self, data, window, refresh_every=50):
+        data = np.asarray(data)
+        self.data = np.ascontiguousarray(data, dtype=data.dtype if data.dtype == np.float32 else np.float64)
+        if window < 2 or window > self.data.shape[0]:
+            raise ValueError("Window must be between 2 and the number of observations.")
+        self.window = window
+        self.refresh_every = refresh_every
+        self._start = None
+        self._updates = 0
+
+    def _rebuild(self, start):
+        # Accumulate around a shift close to the window mean so the cross-product does not cancel catastrophically.
+        block = self.data[start:start + self.window].astype(np.float64)
+        self._shift = block.mean(axis=0)
+        centered = block - self._shift
+        self._sum = centered.sum(axis=0)
+        self._cross = centered.T @ centered
+        self._start = start
+        self._updates = 0
+
+    def _advance(self, start):
+        old = self.data[self._start:start] - self._shift
+        new = self.data[self._start + self.window:start + self.window] - self._shift
+        self._sum += new.sum(axis=0) - old.sum(axis=0)
+        self._cross += new.T @ new - old.T @ old
+        self._start = start
+        self._updates += 1
+
+    def moments(self, start):
+        """Return the daily mean and covariance of rows [start, start + window)."""
+        if start < 0 or start + self.window > self.data.shape[0]:
+            raise ValueError("Window extends beyond the available data.")
+        if (self._start is None or start < self._start or start - self._start >= self.window
+                or self._updates >= self.refresh_every):
+            self._rebuild(start)
+        elif start > self._start:
+            self._advance(start)
+        n = self.window
+        centered_mean = self._sum / n
+        cov = (self._cross - n * np.outer(centered_mean, centered_mean)) / (n - 1)
+        cov = 0.5 * (cov + cov.T)
+        return self._shift + centered_mean, cov
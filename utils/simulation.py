@@ -0,0 +1,48 @@
+"""
+Module: simulation.py
+
+Purpose:
+    Provides a batched Monte Carlo engine for random long-only portfolios. Whole blocks of weight vectors are drawn
+    at once and their returns, volatilities and Sharpe ratios are evaluated as array operations against the cached
+    moments, so the engine scales to millions of portfolios without Python-level loops.
+
+Classes:
+    SimulationMixin:
+        Methods:
+            - random_portfolios(num_portfolios, chunk_size, seed, return_weights):
+                  Draws uniformly random weights normalized to sum to one, in chunks of at most chunk_size rows to
+                  bound memory, and returns arrays of annualized returns, volatilities and Sharpe ratios
+                  (plus the weight matrix when return_weights is True).
+"""
+
+import numpy as np
+
+# Default chunk budget: about 64 MB of float64 weights per block.
+_CHUNK_ELEMENTS = 8_000_000
+
+
+class SimulationMixin:
+    def random_portfolios(self, num_portfolios=5000, chunk_size=None, seed=None, return_weights=False):
+        """Simulate random portfolios and return (returns, volatilities, sharpe_ratios[, weights]) arrays."""
+        rng = np.random.default_rng(seed)
+        moments = self.moments
+        if chunk_size is None:
+            chunk_size = max(1, _CHUNK_ELEMENTS // max(self.num_assets, 1))
+        rets = np.empty(num_portfolios)
+        vols = np.empty(num_portfolios)
+        weights = np.empty((num_portfolios, self.num_assets)) if return_weights else None
+
+        for start in range(0, num_portfolios, chunk_size):
+            stop = min(start + chunk_size, num_portfolios)
+            w = rng.random((stop - start, self.num_assets))
+            w /= w.sum(axis=1, keepdims=True)
+            rets[start:stop] = w @ moments.mean
+            vols[start:stop] = np.sqrt(moments.batch_variance(w))
+            if return_weights:
+                weights[start:stop] = w
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpes = np.where(vols == 0, 0.001, (rets - self.risk_free_rate) / vols)
+        if return_weights:
+            return rets, vols, sharpes, weights
+        return rets, vols, sharpes
@@ -0,0 +1,218 @@
+"""
+Module: stages.py
+
+Purpose:
+    Executes a pipeline expressed as a small dependency graph of named stages. Every stage whose dependencies are
+    finished is submitted to a thread or process pool, so independent stages overlap. Stage results can be persisted
+    under a fingerprint of the stage's name, parameters, code, the fingerprints of its dependencies and a digest of the
+    utils package sources, so that a rerun with the same inputs and code only executes the stages whose inputs
+    changed.
+
+Classes and Functions:
+    source_digest(directory):
+        sha256 of every .py file in directory (default: this package), computed once per process.
+    StageGraph:
+        Constructor:
+            - __init__(version):
+                  version is mixed into every fingerprint; it defaults to source_digest() so that editing any
+                  module the stages call invalidates their cached results.
+        Methods:
+            - add(name, func, deps, params, cache, options):
+                  Registers a stage computed as func(*dependency_results, **params, **options). params are part of
+                  the fingerprint; options (worker counts and the like) are not. Uncached stages always run, and
+                  their fingerprint is taken from their output, so an unchanged output still lets the stages that
+                  depend on it be served from the cache.
+            - run(jobs, backend, cache_dir):
+                  Runs the graph with up to `jobs` concurrent stages on a 'thread' or 'process' pool (jobs=1 runs
+                  in the calling thread) and returns {stage name: result}. `log` lists (name, status, seconds) in
+                  completion order, with status 'ran' or 'cached'. A failing stage raises StageFailed, chained
+                  to the original exception.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import time
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+import pandas as pd
+from .instrumentation import PROFILER, peak_memory
+from .result_cache import fingerprint
+
+
+def _digest(value):
+    if isinstance(value, pd.DataFrame):
+        return fingerprint(value)
+    return hashlib.sha256(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)).hexdigest()
+
+
+def _code_digest(code, h=None):
+    # Nested code objects (comprehensions, lambdas) are hashed by content; their repr carries a memory address.
+    h = h or hashlib.sha256()
+    h.update(code.co_code)
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _code_digest(const, h)
+        else:
+            h.update(repr(const).encode())
+    return h.hexdigest()
+
+
+def _call(func, args, kwargs):
+    start = time.perf_counter()
+    with peak_memory() as memory:
+        value = func(*args, **kwargs)
+    return value, time.perf_counter() - start, memory['bytes']
+
+
+class _InlineExecutor:
+    """Runs submitted calls immediately in the calling thread."""
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+class StageFailed(Exception):
+    def __init__(self, stage, error):
+        super().__init__(f"Stage {stage!r} failed: {error}")
+        self.stage = stage
+
+
+@lru_cache(maxsize=None)
+def source_digest(directory=os.path.dirname(os.path.abspath(__file__))):
+    h = hashlib.sha256()
+    for entry in sorted(os.listdir(directory)):
+        if entry.endswith('.py'):
+            h.update(entry.encode())
+            with open(os.path.join(directory, entry), 'rb') as f:
+                h.update(f.read())
+    return h.hexdigest()
+
+
+class StageGraph:
+    def __init__(self, version=None):
+        self.version = source_digest() if version is None else version
+        self.stages = {}
+        self.log = []
+
+    def add(self, name, func, deps=(), params=None, cache=True, options=None):
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name!r} depends on unknown stage {dep!r}.")
+        self.stages[name] = {'func': func, 'deps': tuple(deps), 'params': dict(params or {}), 'cache': cache,
+                             'options': dict(options or {})}
+        return self
+
+    def _input_fingerprint(self, name, fingerprints):
+        stage = self.stages[name]
+        func = stage['func']
+        # The stage function's own bytecode is included so that editing a stage invalidates its cached result.
+        code = getattr(func, '__code__', None)
+        code = _code_digest(code) if code else ''
+        payload = json.dumps({'version': self.version, 'name': name,
+                              'func': f"{func.__module__}.{func.__qualname__}", 'code': code,
+                              'params': stage['params'], 'deps': [fingerprints[d] for d in stage['deps']]},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _cache_path(self, cache_dir, name, key):
+        safe = ''.join(c if c.isalnum() or c in '-_' else '_' for c in name)
+        return os.path.join(cache_dir, f"{safe}-{key[:20]}.pkl")
+
+    def _load(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return True, pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return False, None
+
+    def _store(self, cache_dir, name, key, value):
+        path = self._cache_path(cache_dir, name, key)
+        prefix = os.path.basename(path).rsplit('-', 1)[0] + '-'
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            os.remove(tmp)
+            print(f"Stage {name} result is not cacheable: {e}")
+            return
+        os.replace(tmp, path)
+        # Keep only the latest result of each stage.
+        for entry in os.scandir(cache_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith('.pkl') and entry.path != path:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def run(self, jobs=1, backend='thread', cache_dir=None):
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+        if jobs <= 1:
+            executor = _InlineExecutor()
+        elif backend == 'thread':
+            executor = ThreadPoolExecutor(max_workers=jobs, thread_name_prefix='stage')
+        elif backend == 'process':
+            executor = ProcessPoolExecutor(max_workers=jobs)
+        else:
+            raise ValueError("backend must be 'thread' or 'process'.")
+
+        self.log = []
+        results, fingerprints, keys = {}, {}, {}
+        pending = list(self.stages)
+        running = {}
+        try:
+            while pending or running:
+                progressed = True
+                while progressed:
+                    progressed = False
+                    for name in list(pending):
+                        stage = self.stages[name]
+                        if not all(dep in results for dep in stage['deps']):
+                            continue
+                        pending.remove(name)
+                        key = keys[name] = self._input_fingerprint(name, fingerprints)
+                        if stage['cache'] and cache_dir is not None:
+                            found, value = self._load(self._cache_path(cache_dir, name, key))
+                            if found:
+                                results[name], fingerprints[name] = value, key
+                                self.log.append((name, 'cached', 0.0))
+                                progressed = True
+                                continue
+                        args = [results[dep] for dep in stage['deps']]
+                        kwargs = dict(stage['params'], **stage['options'])
+                        running[executor.submit(_call, stage['func'], args, kwargs)] = name
+                if not running:
+                    if pending:
+                        raise ValueError(f"Stages {pending} can never run.")
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    try:
+                        value, seconds, peak_bytes = future.result()
+                    except Exception as e:
+                        raise StageFailed(name, e) from e
+                    results[name] = value
+                    PROFILER.record(f"stage:{name}", seconds, peak_bytes)
+                    self.log.append((name, 'ran', seconds))
+                    if stage['cache']:
+                        fingerprints[name] = keys[name]
+                        if cache_dir is not None:
+                            self._store(cache_dir, name, keys[name], value)
+                    else:
+                        fingerprints[name] = _digest(value)
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return results
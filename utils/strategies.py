@@ -0,0 +1,70 @@
+"""
+Module: strategies.py
+
+Purpose:
+    Provides a registry of portfolio construction strategies keyed by their short method name (e.g. "max_sharpe").
+    Backtests, the CLI and the web app look strategies up here instead of dispatching through if/elif chains,
+    so a new strategy only needs to be registered once.
+
+Classes and Functions:
+    Strategy:
+        Constructor:
+            - __init__(key, name, func, description):
+                  Stores the method key, display name, callable and a one-line description.
+        Methods:
+            - run(optimizer):
+                  Runs the strategy on a PortfolioOptimizer and returns its (weights, return, volatility) tuple.
+    register_strategy(key, name, func, description):
+        Registers a callable taking a PortfolioOptimizer. Can also be used as a decorator when func is omitted.
+    get_strategy(key):
+        Returns the registered Strategy, raising ValueError for unknown keys.
+    STRATEGIES:
+        Ordered mapping of method key -> Strategy holding the built-in strategies.
+"""
+
+
+class Strategy:
+    def __init__(self, key, name, func, description=''):
+        self.key = key
+        self.name = name
+        self.func = func
+        self.description = description
+
+    def run(self, optimizer):
+        return self.func(optimizer)
+
+
+STRATEGIES = {}
+
+
+def register_strategy(key, name, func=None, description=''):
+    """Register a strategy callable under key; usable as a decorator when func is omitted."""
+    def decorator(func):
+        STRATEGIES[key] = Strategy(key, name, func, description)
+        return func
+    if func is None:
+        return decorator
+    return decorator(func)
+
+
+def get_strategy(key):
+    try:
+        return STRATEGIES[key]
+    except KeyError:
+        raise ValueError("Unsupported optimization method.") from None
+
+
+register_strategy('max_sharpe', 'Maximum Sharpe Ratio', lambda opt: opt.maximize_sharpe_ratio(),
+                  'Optimizes the Sharpe ratio for best return per unit risk.')
+register_strategy('min_vol', 'Minimum Volatility', lambda opt: opt.minimize_volatility(),
+                  'Minimizes portfolio volatility.')
+register_strategy('HRP', 'Hierarchical Risk Parity', lambda opt: opt.hierarchical_risk_parity(),
+                  'Clusters assets and allocates risk evenly.')
+register_strategy('ERC', 'Equal Risk Contribution', lambda opt: opt.equal_risk_contribution(),
+                  'Balances risk contribution among assets.')
+register_strategy('Eq', 'Equal Weight', lambda opt: opt.equal_weight(),
+                  'Assigns equal weight to each asset.')
+register_strategy('max_div', 'Maximum Diversification', lambda opt: opt.maximum_diversification(),
+                  'Maximizes diversification ratio.')
+register_strategy('min_cvar', 'Minimum CVaR', lambda opt: opt.minimize_cvar(alpha=0.05),
+                  'Minimizes potential tail losses (CVaR).')
@@ -6,68 +6,343 @@ Purpose:
     Downloads historical price data and converts it into returns while addressing outliers.
 
 Classes:
+    Preprocessing stages (each exposes reset() and process(frame), works on whole NumPy blocks and carries whatever
+    state it needs from one chunk to the next, so a long history can be fed through in pieces):
+        - Returns():
+              Simple returns p_t / p_{t-1} - 1; the first row of the stream has no predecessor and is dropped.
+        - LogReturns():
+              Log returns log(p_t / p_{t-1}).
+        - AlignMissing(method, limit):
+              Aligns the panel on complete rows. 'drop' drops every row with a missing value; 'ffill' forward-fills
+              up to `limit` consecutive gaps first and then drops the rows that are still incomplete.
+        - Clip(lower, upper):
+              Clips every value to [lower, upper].
+        - ZScoreFilter(threshold, window, replace):
+              Flags values whose z-score exceeds `threshold` and replaces them with the reference mean ('mean'),
+              the nearest band edge ('clip') or NaN ('nan'). The reference statistics are the trailing `window`
+              rows when a window is given, otherwise the expanding statistics of everything seen so far (the full
+              sample when the data arrives in one chunk).
+        - Winsorize(k, window):
+              ZScoreFilter that pulls values back to mean ± k standard deviations.
+    PreprocessingPipeline:
+        Constructor:
+            - __init__(stages):
+                  Chains the stages in order.
+        Methods:
+            - stream(chunks):
+                  Resets the stages and yields one processed frame per input chunk, keeping memory bounded by
+                  the chunk size.
+            - run(data, chunk_size):
+                  Processes a DataFrame (optionally in chunks of `chunk_size` rows) or an iterable of chunks and
+                  returns the concatenated result.
+    default_pipeline():
+        Returns -> AlignMissing('drop') -> ZScoreFilter(3): daily returns with full-sample outliers replaced by the
+        column mean.
+    TickerValidityCache:
+        Constructor:
+            - __init__(valid_ttl, invalid_ttl):
+                  Creates a thread-safe cache of symbol validity; valid and invalid results expire separately.
+        Methods:
+            - get(symbol):
+                  Returns True/False for a fresh cached result, or None when the symbol is unknown or expired.
+            - set(symbol, valid):
+                  Records the validity of a symbol.
     TickerData:
         Constructor:
-            - __init__(tickers, start_date, end_date):
-                  Initializes the instance with a list of ticker symbols and a date range.
+            - __init__(tickers, start_date, end_date, cache, validity_cache, max_workers, pipeline):
+                  Initializes the instance with a list of ticker symbols and a date range. Symbols are upper-cased
+                  and de-duplicated the way Yahoo Finance reports them. When a PriceCache is given,
+                  prices are served from it and only missing date ranges are fetched from its provider. Validity
+                  results are shared process-wide through a TickerValidityCache. `pipeline` overrides the
+                  preprocessing applied to the prices (default_pipeline() when omitted).
         Methods:
-            - check_ticker(ticker_symbol):
-                  Checks if a given ticker symbol is valid by attempting to access its information.
+            - check_ticker(ticker_symbol, refresh):
+                  Checks if a given ticker symbol is valid by attempting to access its information. refresh=True
+                  ignores a cached result.
             - check_tickers():
-                  Iterates over all tickers and returns a list of invalid ones, if any.
+                  Returns a list of invalid tickers, if any. Cached results are reused and only unknown symbols are
+                  looked up, concurrently through a bounded thread pool.
             - ticker_data():
-                  If all tickers are valid, downloads historical price data for the tickers,
-                  computes daily returns from closing prices, identifies outliers using z-scores,
-                  and replaces outliers with the column mean. Returns the processed returns DataFrame.
+                  Downloads historical price data for the tickers in one batch; symbols with prices are cached as
+                  valid. Symbols without prices are confirmed with check_ticker (a failed or rate-limited download
+                  also yields an empty column), so only symbols whose lookup fails are cached as invalid; the others
+                  are reported as temporarily unavailable. Otherwise runs the closing prices through the
+                  preprocessing pipeline and returns the processed returns DataFrame.
 """
 
 
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 import pandas as pd
 import numpy as np
+from .instrumentation import instrument
+from .price_cache import normalize_symbols
+
+
+def _frame(values, index, columns):
+    return pd.DataFrame(values, index=index, columns=columns, copy=False)
+
+
+class Returns:
+    def reset(self):
+        self._last = None
+
+    def _ratio(self, frame):
+        values = frame.to_numpy(dtype=np.float64)
+        if not len(values):
+            return values, frame.index
+        if self._last is None:
+            previous, current, index = values[:-1], values[1:], frame.index[1:]
+        else:
+            previous, current, index = np.vstack([self._last, values[:-1]]), values, frame.index
+        self._last = values[-1:].copy()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return current / previous, index
+
+    def process(self, frame):
+        ratio, index = self._ratio(frame)
+        return _frame(ratio - 1, index, frame.columns)
+
+
+class LogReturns(Returns):
+    def process(self, frame):
+        ratio, index = self._ratio(frame)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return _frame(np.log(ratio), index, frame.columns)
+
+
+class AlignMissing:
+    def __init__(self, method='drop', limit=None):
+        if method not in ('drop', 'ffill'):
+            raise ValueError("method must be 'drop' or 'ffill'.")
+        self.method = method
+        self.limit = limit
+
+    def reset(self):
+        self._tail = None
+
+    def process(self, frame):
+        if self.method == 'ffill':
+            # Prepend the rows the fill may reach back to: the last filled row without a limit, otherwise the last
+            # `limit` raw rows so that a gap running across the chunk boundary is counted once.
+            raw = frame
+            if self._tail is not None:
+                frame = pd.concat([self._tail, frame])
+            filled = frame.ffill(limit=self.limit)
+            if self.limit is None:
+                self._tail = filled.iloc[-1:] if len(filled) else self._tail
+            elif self.limit > 0:
+                self._tail = frame.iloc[-self.limit:]
+            frame = filled.iloc[len(filled) - len(raw):]
+        complete = ~np.isnan(frame.to_numpy(dtype=np.float64)).any(axis=1)
+        return frame if complete.all() else frame[complete]
+
+
+class Clip:
+    def __init__(self, lower=None, upper=None):
+        self.lower = lower
+        self.upper = upper
+
+    def reset(self):
+        pass
+
+    def process(self, frame):
+        return frame.clip(lower=self.lower, upper=self.upper)
+
+
+class ZScoreFilter:
+    def __init__(self, threshold=3.0, window=None, replace='mean'):
+        if replace not in ('mean', 'clip', 'nan'):
+            raise ValueError("replace must be 'mean', 'clip' or 'nan'.")
+        if window is not None and window < 2:
+            raise ValueError("window must be at least 2.")
+        self.threshold = threshold
+        self.window = window
+        self.replace = replace
+
+    def reset(self):
+        self._tail = None
+        self._count = self._shift = self._sum = self._sumsq = None
+
+    def _expanding_stats(self, values):
+        # Sums are taken around the first observation of each column so the variance does not cancel badly.
+        if self._shift is None:
+            self._shift = np.nan_to_num(values[0])
+            self._count = np.zeros(values.shape[1])
+            self._sum = np.zeros(values.shape[1])
+            self._sumsq = np.zeros(values.shape[1])
+        centered = values - self._shift
+        observed = ~np.isnan(centered)
+        centered = np.where(observed, centered, 0.0)
+        self._count += observed.sum(axis=0)
+        self._sum += centered.sum(axis=0)
+        self._sumsq += np.einsum('ij,ij->j', centered, centered)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = self._sum / self._count
+            var = (self._sumsq - self._sum * offset) / (self._count - 1)
+        return self._shift + offset, np.sqrt(np.clip(var, 0.0, None))
+
+    def _rolling_stats(self, values):
+        history = values if self._tail is None else np.vstack([self._tail, values])
+        self._tail = history[-(self.window - 1):]
+        # Trailing-window sums as differences of cumulative sums, taken around the block mean to limit cancellation.
+        # Rows at the very start of the stream see fewer than `window` observations and keep their expanding sums.
+        shift = np.nan_to_num(np.nanmean(history, axis=0))
+        centered = history - shift
+        observed = ~np.isnan(centered)
+        centered[~observed] = 0.0
+        stats = []
+        for block in (observed.astype(np.float64), centered, centered * centered):
+            total = np.cumsum(block, axis=0)
+            total[self.window:] -= total[:-self.window].copy()
+            stats.append(total[-len(values):])
+        count, s1, s2 = stats
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = s1 / count
+            var = (s2 - s1 * offset) / (count - 1)
+        return shift + offset, np.sqrt(np.clip(var, 0.0, None))
+
+    def process(self, frame):
+        values = frame.to_numpy(dtype=np.float64)
+        if not len(values):
+            return frame
+        mean, std = self._expanding_stats(values) if self.window is None else self._rolling_stats(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            outliers = np.abs(values - mean) > self.threshold * std
+        if not outliers.any():
+            return frame
+        if self.replace == 'mean':
+            fill = np.broadcast_to(mean, values.shape)
+        elif self.replace == 'clip':
+            fill = np.clip(values, mean - self.threshold * std, mean + self.threshold * std)
+        else:
+            fill = np.nan
+        return _frame(np.where(outliers, fill, values), frame.index, frame.columns)
+
+
+class Winsorize(ZScoreFilter):
+    def __init__(self, k=3.0, window=None):
+        super().__init__(threshold=k, window=window, replace='clip')
+
+
+class PreprocessingPipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def stream(self, chunks):
+        """Yield one processed frame per input chunk, carrying stage state across chunk boundaries."""
+        for stage in self.stages:
+            stage.reset()
+        for chunk in chunks:
+            for stage in self.stages:
+                chunk = stage.process(chunk)
+            yield chunk
+
+    def run(self, data, chunk_size=None):
+        """Process a DataFrame (in chunks of chunk_size rows if given) or an iterable of chunks."""
+        if isinstance(data, pd.DataFrame):
+            step = chunk_size or max(len(data), 1)
+            chunks = (data.iloc[i:i + step] for i in range(0, max(len(data), 1), step))
+        else:
+            chunks = data
+        parts = list(self.stream(chunks))
+        return parts[0] if len(parts) == 1 else pd.concat(parts)
+
+
+def default_pipeline():
+    return PreprocessingPipeline([Returns(), AlignMissing('drop'), ZScoreFilter(3)])
+
+
+class TickerValidityCache:
+    def __init__(self, valid_ttl=24 * 3600, invalid_ttl=3600):
+        self.valid_ttl = valid_ttl
+        self.invalid_ttl = invalid_ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol):
+        with self._lock:
+            entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        valid, stamp = entry
+        ttl = self.valid_ttl if valid else self.invalid_ttl
+        return valid if time.monotonic() - stamp < ttl else None
+
+    def set(self, symbol, valid):
+        with self._lock:
+            self._entries[symbol] = (bool(valid), time.monotonic())
+
+
+_VALIDITY_CACHE = TickerValidityCache()
+
 
 class TickerData:
-    def __init__(self, tickers, start_date, end_date):
-        self.tickers = tickers
+    def __init__(self, tickers, start_date, end_date, cache=None, validity_cache=None, max_workers=8,
+                 pipeline=None):
+        self.tickers = normalize_symbols(tickers)
         self.start_date = start_date
         self.end_date = end_date
-    
-    def check_ticker(self, ticker_symbol):
+        self.cache = cache
+        self.validity_cache = validity_cache if validity_cache is not None else _VALIDITY_CACHE
+        self.max_workers = max_workers
+        self.pipeline = pipeline if pipeline is not None else default_pipeline()
+
+    def check_ticker(self, ticker_symbol, refresh=False):
+        cached = None if refresh else self.validity_cache.get(ticker_symbol)
+        if cached is not None:
+            return cached
         try:
             stock = yf.Ticker(ticker_symbol)
-            stock.info  
-            return True 
+            stock.info
+            valid = True
         except Exception:
-            return False
+            valid = False
+        self.validity_cache.set(ticker_symbol, valid)
+        return valid
 
     def check_tickers(self):
-        invalid_tickers = []
-        for ticker in self.tickers:
-            if not self.check_ticker(ticker):
-                invalid_tickers.append(ticker)
-        return invalid_tickers
+        unknown = [t for t in self.tickers if self.validity_cache.get(t) is None]
+        if unknown:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unknown))) as pool:
+                list(pool.map(self.check_ticker, unknown))
+        return [t for t in self.tickers if not self.check_ticker(t)]
+
+    def _known_invalid(self):
+        return [t for t in self.tickers if self.validity_cache.get(t) is False]
 
+    @instrument('data:ticker_data')
     def ticker_data(self):
-        if self.check_tickers():
-            return f"Invalid tickers: {self.check_tickers()}"
+        invalid_tickers = self._known_invalid()
+        if invalid_tickers:
+            return f"Invalid tickers: {invalid_tickers}"
+
+        # Fix: Download price data (through the local cache when one is configured)
+        if self.cache is not None:
+            prices = self.cache.get(self.tickers, self.start_date, self.end_date)
         else:
-            # Fix: Download price data
             data = yf.download(self.tickers, start=self.start_date, end=self.end_date)
-            
-            # Fix: Calculate returns instead of using raw prices
             prices = data['Close']
-            
-            # Convert to returns
-            returns = prices.pct_change().dropna()
-            
-            # Detect and handle outliers
-            z_scores = np.abs((returns - returns.mean()) / returns.std())
-            outliers = z_scores > 3
-            
-            # Replace outliers with column means
-            for col in returns.columns:
-                col_outliers = outliers[col]
-                if col_outliers.any():
-                    returns.loc[col_outliers, col] = returns[col].mean()
-                    
-            return returns
\ No newline at end of file
+            if isinstance(prices, pd.Series):
+                prices = prices.to_frame(self.tickers[0])
+
+        # A symbol with prices is valid. An empty column may only be a failed download, so it is confirmed with a
+        # metadata lookup before being cached as invalid.
+        prices = prices.reindex(columns=self.tickers)
+        has_data = prices.notna().any()
+        missing = [t for t in self.tickers if not has_data[t]]
+        for ticker in self.tickers:
+            if has_data[ticker]:
+                self.validity_cache.set(ticker, True)
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as pool:
+                confirmed = list(pool.map(lambda t: self.check_ticker(t, refresh=True), missing))
+            invalid_tickers = [t for t, valid in zip(missing, confirmed) if not valid]
+            if invalid_tickers:
+                return f"Invalid tickers: {invalid_tickers}"
+            return f"No price data returned for tickers: {missing}; please try again later"
+
+        # Fix: Calculate returns instead of using raw prices, then align and handle outliers
+        return self.pipeline.run(prices)
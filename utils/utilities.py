@@ -11,11 +11,14 @@ Classes and Functions:
             - calculate_turnover(old_weights, new_weights):
                   Computes the turnover between two sets of portfolio weights by calculating the half-sum of the absolute differences.
     save_fig(fig, filepath):
-        Attempts to save a Plotly figure to an image file using Kaleido. If the primary method fails,
-        it falls back to an alternative method to save the image, and prints messages indicating success or failure.
+        Renders a Plotly figure to image bytes with Kaleido exactly once and writes them to the file, printing
+        whether it succeeded. Returns True if the image was written. Use utils.rendering.render_figures to
+        render many figures at once.
 """
 
+import os
 import numpy as np
+from .instrumentation import instrument
 
 class UtilityMixin:
     @staticmethod
@@ -23,21 +26,19 @@ class UtilityMixin:
         """Calculate portfolio turnover between two weight vectors."""
         return np.sum(np.abs(new_weights - old_weights)) / 2
     
+@instrument('render:save_fig')
 def save_fig(fig, filepath):
     """
-    Attempts to save a Plotly figure to an image file using Kaleido.
-    If fig.write_image() fails, it falls back to using fig.to_image().
+    Renders a Plotly figure once with Kaleido and writes the image bytes to filepath;
+    the format follows the file extension (PNG by default).
     """
+    fmt = os.path.splitext(filepath)[1].lstrip('.').lower() or 'png'
     try:
-        fig.write_image(filepath, engine="kaleido")
-        print(f"Saved figure to {filepath} using write_image().")
+        img_bytes = fig.to_image(format=fmt)
     except Exception as e:
-        print(f"write_image() failed for {filepath}: {e}")
-        try:
-            # Fallback: use to_image() to get image bytes and write manually
-            img_bytes = fig.to_image(format="png", engine="kaleido")
-            with open(filepath, "wb") as f:
-                f.write(img_bytes)
-            print(f"Saved figure to {filepath} using to_image() fallback.")
-        except Exception as e:
-            print(f"Fallback failed for {filepath}: {e}")
\ No newline at end of file
+        print(f"Rendering failed for {filepath}: {e}")
+        return False
+    with open(filepath, "wb") as f:
+        f.write(img_bytes)
+    print(f"Saved figure to {filepath}.")
+    return True
@@ -8,46 +8,54 @@ Purpose:
 Classes:
     VisualizationMixin:
         Methods:
-            - plot_efficient_frontier(num_portfolios=1000):
-                  Simulates a number of random portfolios and plots the efficient frontier (risk-return trade-off)
-                  along with a color gradient representing the Sharpe ratio.
+            - plot_efficient_frontier(num_portfolios=1000, points=50):
+                  Simulates a number of random portfolios (via random_portfolios), colored by Sharpe ratio, and
+                  overlays the exact efficient frontier traced by the critical line algorithm.
             - plot_portfolio_allocation():
                   Generates bar charts showing the portfolio allocation based on stored weights.
             - plot_risk_contributions():
                   Creates bar charts of the risk contributions from each asset using the current portfolio weights.
-            - plot_cumulative_returns():
-                  Plots the cumulative returns of the portfolio over time using stored weights.
-            - plot_correlation_matrix():
-                  Creates a heatmap of the correlation matrix computed from asset returns.
+            - plot_cumulative_returns(max_points=None):
+                  Plots the cumulative returns of the portfolio over time using stored weights, downsampled to
+                  max_points (default max_plot_points) while keeping the maximum drawdown's peak and trough.
+            - plot_correlation_matrix(ordered=False, linkage_method='single'):
+                  Creates a heatmap of the cached correlation matrix, optionally reordered by the same hierarchical
+                  clustering (and cached distance matrix) that HRP uses.
             - simulate_random_portfolios(num_portfolios=5000):
-                  Simulates a large number of random portfolios, plotting both the risk-return scatter plot
-                  and a histogram of Sharpe ratios.
+                  Simulates a large number of random portfolios with the batched random_portfolios engine, plotting
+                  both the risk-return scatter plot and a histogram of Sharpe ratios.
 """
 
 
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+from scipy.cluster.hierarchy import leaves_list
+from .downsample import DEFAULT_MAX_POINTS, downsample_figure
 
 class VisualizationMixin:
-    def plot_efficient_frontier(self, num_portfolios=1000):
-        """Plot the efficient frontier by simulating random portfolios using Plotly."""
-        results = np.zeros((3, num_portfolios))
-        for i in range(num_portfolios):
-            w = np.random.random(self.num_assets)
-            w /= np.sum(w)
-            ret, vol = self.calculate_portfolio_performance(w)
-            results[0, i] = ret
-            results[1, i] = vol
-            results[2, i] = self.calculate_sharpe_ratio(w)
+    # Line charts of long histories are reduced to this many points (None keeps every point).
+    max_plot_points = DEFAULT_MAX_POINTS
+
+    def plot_efficient_frontier(self, num_portfolios=1000, points=50):
+        """Plot the exact efficient frontier over a cloud of simulated random portfolios using Plotly."""
+        rets, vols, sharpes = self.random_portfolios(num_portfolios)
+        frontier_rets, frontier_vols, _ = self.efficient_frontier(points)
         
         fig = px.scatter(
-            x=results[1, :], 
-            y=results[0, :], 
-            color=results[2, :], 
+            x=vols, 
+            y=rets, 
+            color=sharpes, 
             labels={'x': 'Annualized Volatility', 'y': 'Annualized Return', 'color': 'Sharpe Ratio'},
             title="Efficient Frontier"
         )
+        fig.add_trace(go.Scatter(
+            x=frontier_vols,
+            y=frontier_rets,
+            mode='lines',
+            name="Efficient Frontier",
+            line=dict(color='black')
+        ))
         return fig
 
     def plot_portfolio_allocation(self):
@@ -85,61 +93,58 @@ class VisualizationMixin:
             figlist[weights]=fig
         return figlist
 
-    def plot_cumulative_returns(self):
+    def plot_cumulative_returns(self, max_points=None):
         """Plot cumulative portfolio returns over time using Plotly."""
         figlist={}
         if self.weight_list is None:
             print("Run an optimization method first to get weights.")
             return
         for weights in self.weight_list:
-            port_returns = self.returns @ self.weight_list[weights]
+            port_returns = self._portfolio_returns(self.weight_list[weights])
             cum_returns = np.cumprod(1 + port_returns) - 1
             
             fig = px.line(
-                x=self.returns.index, 
+                x=self.index, 
                 y=cum_returns, 
                 labels={'x': 'Time', 'y': 'Cumulative Return'},
                 title="Cumulative Portfolio Returns"
             )
+            downsample_figure(fig, max_points or self.max_plot_points, offset=1.0)
             figlist[weights]=fig
         return figlist
 
-    def plot_correlation_matrix(self):
+    def plot_correlation_matrix(self, ordered=False, linkage_method='single'):
         """Plot a heatmap of the asset return correlation matrix using Plotly."""
-        corr = self.returns.corr()
+        corr = self.moments.corr
+        assets = self.returns.columns.tolist()
+        if ordered:
+            order = leaves_list(self.moments.linkage(linkage_method))
+            corr = corr[np.ix_(order, order)]
+            assets = [assets[i] for i in order]
         
         fig = px.imshow(
             corr, 
             labels=dict(color="Correlation"),
-            x=corr.columns,
-            y=corr.columns,
+            x=assets,
+            y=assets,
             title="Correlation Matrix"
         )
         return fig
 
     def simulate_random_portfolios(self, num_portfolios=5000):
         """Simulate random portfolios and plot their risk-return distribution using Plotly."""
-        results = np.zeros((3, num_portfolios))
-        weight_records = []
-        for i in range(num_portfolios):
-            w = np.random.random(self.num_assets)
-            w /= np.sum(w)
-            weight_records.append(w)
-            ret, vol = self.calculate_portfolio_performance(w)
-            results[0, i] = ret
-            results[1, i] = vol
-            results[2, i] = self.calculate_sharpe_ratio(w)
+        rets, vols, sharpes = self.random_portfolios(num_portfolios)
         
         scatter_fig = px.scatter(
-            x=results[1, :], 
-            y=results[0, :], 
-            color=results[2, :], 
+            x=vols, 
+            y=rets, 
+            color=sharpes, 
             labels={'x': 'Annualized Volatility', 'y': 'Annualized Return', 'color': 'Sharpe Ratio'},
             title="Random Portfolios Simulation"
         )
         
         hist_fig = px.histogram(
-            x=results[2, :], 
+            x=sharpes, 
             nbins=50, 
             labels={'x': 'Sharpe Ratio', 'y': 'Frequency'},
             title="Distribution of Sharpe Ratios"